@@ -1,15 +1,23 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
 from deep_sort_realtime.deepsort_tracker import DeepSort
 from scipy.ndimage import gaussian_filter
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import os
 import uuid
 import base64
-import subprocess
 import logging
 import time
+from pipeline import StagePipeline, PipelineAborted, RENDER_WORKERS
+from encoder import open_video_writer
+from density import tracks_to_boxes, compute_grid_density, UnsafeCellMonitor, DensityForecaster, FOOT_POINT_RATIO
+from rendering import OverlayRenderer, LiveHeatmap
+from gridstore import GridCountSeries, save_grid_counts
+from scheduler import AdaptiveFrameScheduler
+from segments import plan_segments, run_segments, CHUNK_WORKERS
+from metrics import StageTimer
+from models import ModelManager, MODEL_FORMAT
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -25,21 +33,41 @@ DEFAULT_GRID = 4
 GRID_SCALE_FACTOR = 1.5
 PREDICTION_HORIZON_SECONDS = 30
 PREDICTION_HISTORY_FRAMES = 45
+TRACKER_MAX_AGE = 30 # Frames DeepSort keeps a track alive without a matching detection
 
 SPEED_THRESHOLD_LOW = 15
 SPEED_THRESHOLD_HIGH = 50
 
 # --- NEW: Frame skipping for live analysis performance ---
-LIVE_ANALYSIS_FRAME_SKIP = 2 # Analyzes 1 frame for every X frames skipped
+LIVE_ANALYSIS_FRAME_SKIP = 2 # Initial skip; AdaptiveFrameScheduler retunes it from measured latency
+LIVE_HEATMAP_INTERVAL_SECONDS = 1.0 # How often the live density heatmap is sent
 
-# --- LOAD MODELS (loaded once) ---
-logger.info("Loading YOLO model...")
-MODEL_PATH = "best_final.pt"
-if not os.path.exists(MODEL_PATH):
-    MODEL_PATH = "best.pt"
-    if not os.path.exists(MODEL_PATH):
-        raise FileNotFoundError("YOLO model not found.")
-model = YOLO(MODEL_PATH)
+PROGRESS_REPORT_INTERVAL = 25 # Frames between progress_callback calls in process_video
+INFERENCE_BATCH_SIZE = 8 # Frames decoded ahead and sent to YOLO in one call by process_video
+RESULT_FORMAT_VERSION = 2 # Bump when process_video's result layout changes (invalidates cached results)
+
+# --- MODELS (one per process, loaded on first use or by model_manager.load()) ---
+model_manager = ModelManager()
+MODEL_PATH = model_manager.weights_path
+
+def set_model(yolo_model):
+    return model_manager.set(yolo_model)
+
+def get_model():
+    return model_manager.get()
+
+def create_tracker():
+    return DeepSort(max_age=TRACKER_MAX_AGE)
+
+def analysis_settings():
+    # Everything besides the model that changes process_video's result for a given video.
+    return {
+        "confidence_threshold": CONFIDENCE_THRESHOLD, "cell_density_threshold": CELL_DENSITY_THRESHOLD, "unsafe_duration": UNSAFE_DURATION,
+        "grid_min": GRID_MIN, "grid_max": GRID_MAX, "default_grid": DEFAULT_GRID, "grid_scale_factor": GRID_SCALE_FACTOR,
+        "prediction_horizon_seconds": PREDICTION_HORIZON_SECONDS, "prediction_history_frames": PREDICTION_HISTORY_FRAMES,
+        "speed_threshold_low": SPEED_THRESHOLD_LOW, "speed_threshold_high": SPEED_THRESHOLD_HIGH, "foot_point_ratio": FOOT_POINT_RATIO,
+        "tracker_max_age": TRACKER_MAX_AGE, "model_format": MODEL_FORMAT, "result_format": RESULT_FORMAT_VERSION,
+    }
 
 # --- HELPER FUNCTIONS ---
 def create_smooth_heatmap_overlay(grid_counts, width, height, grid_rows, grid_cols, is_prediction=False):
@@ -55,152 +83,159 @@ def create_smooth_heatmap_overlay(grid_counts, width, height, grid_rows, grid_co
     norm_heatmap = cv2.normalize(blurred_heatmap, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
     return cv2.applyColorMap(norm_heatmap, cv2.COLORMAP_JET)
 
+def extract_person_detections(result):
+    # One device->host transfer for all boxes of the frame instead of one per box.
+    data = result.boxes.data.cpu().numpy()
+    if len(data) == 0: return []
+    keep = (data[:, 4] > CONFIDENCE_THRESHOLD) & np.isin(data[:, 5].astype(int), model_manager.person_class_ids)
+    return [(list(map(int, row[:4])), float(row[4]), "person") for row in data[keep]]
+
+def detect_people(frames, **model_kwargs):
+    results = get_model()(frames, verbose=False, **model_kwargs)
+    return [extract_person_detections(r) for r in results]
+
+def read_frames(cap, count):
+    frames = []
+    for _ in range(count):
+        ret, frame = cap.read()
+        if not ret: break
+        frames.append(frame)
+    return frames
+
+def update_track_overlays(frame_tracks, track_history):
+    # Advances the per-track motion history and returns (box, det_conf, arrow) for drawing each track.
+    overlays = []
+    current_track_ids = set()
+    for tr in frame_tracks:
+        if tr.track_id is None: continue
+        current_track_ids.add(tr.track_id)
+        x1, y1, x2, y2 = map(int, tr.to_tlbr())
+        arrow = None
+        center_x, center_y = (x1 + x2) // 2, y1 + int((y2 - y1) * 0.8)
+        if tr.track_id not in track_history: track_history[tr.track_id] = deque(maxlen=15)
+        track_history[tr.track_id].append((center_x, center_y))
+        if len(track_history[tr.track_id]) > 10:
+            history = track_history[tr.track_id]
+            dx, dy = history[-1][0] - history[0][0], history[-1][1] - history[0][1]
+            magnitude = np.sqrt(dx**2 + dy**2)
+            if magnitude > 5:
+                arrow_color = (0, 255, 0)
+                if magnitude > SPEED_THRESHOLD_HIGH: arrow_color = (0, 0, 255)
+                elif magnitude > SPEED_THRESHOLD_LOW: arrow_color = (0, 255, 255)
+
+                norm_dx, norm_dy = dx / magnitude, dy / magnitude
+                end_point = (center_x + int(norm_dx * 15), center_y + int(norm_dy * 15))
+                arrow = ((center_x, center_y), end_point, arrow_color)
+        overlays.append(((x1, y1, x2, y2), tr.get_det_conf(), arrow))
+
+    for track_id in list(track_history.keys()):
+        if track_id not in current_track_ids: del track_history[track_id]
+    return overlays
+
 def get_zone_name(gx, gy, grid_size):
     row_pos = "Top" if gy < grid_size / 3 else "Bottom" if gy >= grid_size * 2 / 3 else "Middle"
     col_pos = "Left" if gx < grid_size / 3 else "Right" if gx >= grid_size * 2 / 3 else "Center"
     if row_pos == "Middle" and col_pos == "Center": return "Central Area"
     return f"{row_pos}-{col_pos} Zone"
 
-def predict_future_heatmap(historical_grids: deque, grid_shape: tuple, fps: float):
-    if len(historical_grids) < PREDICTION_HISTORY_FRAMES: return None
-    history_array = np.array(list(historical_grids))
-    velocities = np.diff(history_array, axis=0).mean(axis=0)
-    last_known_grid = historical_grids[-1]
-    predicted_grid = last_known_grid + (velocities * 1.5 * int(PREDICTION_HORIZON_SECONDS * fps))
-    predicted_grid[predicted_grid < 0] = 0
-    high_risk_zones = [[r, c] for r in range(grid_shape[0]) for c in range(grid_shape[1]) if predicted_grid[r, c] >= CELL_DENSITY_THRESHOLD]
+def predict_future_heatmap(forecaster: DensityForecaster, fps: float):
+    predicted_grid = forecaster.forecast(1.5 * int(PREDICTION_HORIZON_SECONDS * fps))
+    if predicted_grid is None: return None
+    high_risk_zones = np.argwhere(predicted_grid >= CELL_DENSITY_THRESHOLD).tolist()
     return {"high_risk_zones": high_risk_zones, "expected_max_density": int(np.max(predicted_grid)), "predicted_grid_counts": predicted_grid}
 
 # --- LIVE STREAM PROCESSING CLASS ---
 class LiveStreamProcessor:
-    def __init__(self):
-        self.tracker = DeepSort(max_age=30)
+    def __init__(self, detector=None, timings=None):
+        # detector: frame -> person detections. Defaults to calling the model inline;
+        # main.py passes the shared InferenceServer so all cameras are batched together.
+        self.detector = detector or (lambda frame: detect_people([frame], half=True)[0])
+        self.timings = timings or StageTimer()
+        self.tracker = create_tracker()
         self.track_history = {}
-        self.unsafe_active = {}
+        self.unsafe_monitor = UnsafeCellMonitor(CELL_DENSITY_THRESHOLD)
+        self.renderer = OverlayRenderer(CELL_DENSITY_THRESHOLD)
         self.GRID_SIZE = DEFAULT_GRID
         self.frame_idx = 0
         self.last_grid_calc_time = 0
-        self.heatmap_acc = None
+        self.live_heatmap = LiveHeatmap()
+        self.last_heatmap_time = 0.0
         self.live_people_counts = []
-        self.grid_history = deque(maxlen=PREDICTION_HISTORY_FRAMES)
+        self.forecaster = DensityForecaster(PREDICTION_HISTORY_FRAMES)
         self.last_known_tracks = [] # NEW: To store tracks for skipped frames
+        self.scheduler = AdaptiveFrameScheduler(LIVE_ANALYSIS_FRAME_SKIP)
 
     def analyze_frame(self, frame):
         self.frame_idx += 1
         frame_h, frame_w, _ = frame.shape
         video_fps = 25.0
+        now = time.monotonic()
 
-        if self.heatmap_acc is None:
-            self.heatmap_acc = np.zeros((frame_h, frame_w), dtype=np.float32)
-
-        vis = frame.copy()
         live_alerts = []
         
-        # --- MODIFIED: Only run heavy analysis periodically ---
-        if self.frame_idx % (LIVE_ANALYSIS_FRAME_SKIP + 1) == 0:
+        # --- MODIFIED: Only run heavy analysis when the scheduler asks for it ---
+        analyzed = self.scheduler.should_analyze()
+        if analyzed:
+            analysis_start = time.perf_counter()
+            with self.timings.time("inference"):
+                detections = self.detector(frame)
             if time.time() - self.last_grid_calc_time > 10:
                 self.last_grid_calc_time = time.time()
-                results_grid = model(frame, verbose=False, half=True)[0]
-                person_heights = [b.xyxy[0][3] - b.xyxy[0][1] for b in results_grid.boxes if b.conf > CONFIDENCE_THRESHOLD and model.names[int(b.cls)] == "person"]
+                # Reuse this frame's detections for grid calibration instead of a second model call
+                person_heights = [y2 - y1 for (_, y1, _, y2), _, _ in detections]
                 if person_heights:
                     avg_h = np.mean(person_heights)
                     raw_grid = int(frame_h / (avg_h * GRID_SCALE_FACTOR + 1e-8))
                     self.GRID_SIZE = max(GRID_MIN, min(raw_grid, GRID_MAX))
 
-            results = model(frame, verbose=False, half=True)[0]
-            detections = [(list(map(int, b.xyxy[0].cpu().numpy())), float(b.conf), "person") for b in results.boxes if b.conf > CONFIDENCE_THRESHOLD and model.names[int(b.cls)] == "person"]
-            tracks = self.tracker.update_tracks(detections, frame=frame)
+            with self.timings.time("tracking"):
+                tracks = self.tracker.update_tracks(detections, frame=frame)
             self.last_known_tracks = [tr for tr in tracks if tr.is_confirmed()]
+            self.scheduler.record_analysis((time.perf_counter() - analysis_start) * 1000)
         
         frame_tracks = self.last_known_tracks
         self.live_people_counts.append(len(frame_tracks))
         
-        cell_w, cell_h = max(1, frame_w // self.GRID_SIZE), max(1, frame_h // self.GRID_SIZE)
-        grid_counts = np.zeros((self.GRID_SIZE, self.GRID_SIZE), dtype=int)
-        
-        for tr in frame_tracks:
-            x1, y1, x2, y2 = map(int, tr.to_tlbr())
-            cx = (x1 + x2) // 2
-            cy = y1 + int((y2 - y1) * 0.8)
-            if 0 <= cx < frame_w and 0 <= cy < frame_h:
-                gx, gy = min(cx // cell_w, self.GRID_SIZE - 1), min(cy // cell_h, self.GRID_SIZE - 1)
-                grid_counts[gy, gx] += 1
-                self.heatmap_acc[cy, cx] += 1.0
-
-        self.grid_history.append(grid_counts)
-        heatmap_overlay = create_smooth_heatmap_overlay(grid_counts, frame_w, frame_h, self.GRID_SIZE, self.GRID_SIZE)
-        cv2.addWeighted(heatmap_overlay, 0.4, vis, 0.6, 0, vis)
-        
-        for gy in range(self.GRID_SIZE):
-            for gx in range(self.GRID_SIZE):
-                count = int(grid_counts[gy, gx])
-                is_unsafe = count >= CELL_DENSITY_THRESHOLD
-                if is_unsafe and (gx, gy) not in self.unsafe_active:
-                    self.unsafe_active[(gx, gy)] = self.frame_idx
-                    live_alerts.append({"id": f"live-dense-{gx}-{gy}", "type": "High Risk Detected", "message": f"Congestion in {get_zone_name(gx, gy, self.GRID_SIZE)}"})
-                elif not is_unsafe and (gx, gy) in self.unsafe_active:
-                    del self.unsafe_active[(gx, gy)]
-                color = (0, 0, 255) if is_unsafe else (0, 200, 0)
-                cv2.rectangle(vis, (gx * cell_w, gy * cell_h), (gx * cell_w + cell_w, gy * cell_h + cell_h), color, 1)
-                text_pos = (gx * cell_w + 5, gy * cell_h + 20)
-                cv2.putText(vis, str(count), text_pos, cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,0,0), 4)
-                cv2.putText(vis, str(count), text_pos, cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-        
-        current_track_ids = set()
-        for tr in frame_tracks:
-            if tr.track_id is not None:
-                current_track_ids.add(tr.track_id)
-                x1, y1, x2, y2 = map(int, tr.to_tlbr())
-                if tr.get_det_conf() is not None:
-                    label = f"P: {tr.get_det_conf():.2f}"
-                    cv2.rectangle(vis, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    (w, h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-                    cv2.rectangle(vis, (x1, y1 - h - 10), (x1 + w, y1 - 5), (0, 255, 0), cv2.FILLED)
-                    cv2.putText(vis, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                
-                center_x, center_y = (x1 + x2) // 2, y1 + int((y2 - y1) * 0.8)
-                if tr.track_id not in self.track_history: self.track_history[tr.track_id] = deque(maxlen=15)
-                self.track_history[tr.track_id].append((center_x, center_y))
-                if len(self.track_history[tr.track_id]) > 10:
-                    history = self.track_history[tr.track_id]
-                    dx, dy = history[-1][0] - history[0][0], history[-1][1] - history[0][1]
-                    magnitude = np.sqrt(dx**2 + dy**2)
-                    if magnitude > 5:
-                        arrow_color = (0, 255, 0)
-                        if magnitude > SPEED_THRESHOLD_HIGH: arrow_color = (0, 0, 255)
-                        elif magnitude > SPEED_THRESHOLD_LOW: arrow_color = (0, 255, 255)
-                        
-                        norm_dx, norm_dy = dx / magnitude, dy / magnitude
-                        end_point = (center_x + int(norm_dx * 15), center_y + int(norm_dy * 15))
-                        cv2.arrowedLine(vis, (center_x, center_y), end_point, arrow_color, 2, tipLength=0.5)
-
-        for track_id in list(self.track_history.keys()):
-            if track_id not in current_track_ids: del self.track_history[track_id]
-        
+        with self.timings.time("grid"):
+            boxes = tracks_to_boxes(frame_tracks)
+            grid_counts = compute_grid_density(boxes, frame_w, frame_h, self.GRID_SIZE)
+            self.live_heatmap.add(boxes, frame_w, frame_h, now)
+            self.forecaster.update(grid_counts)
+
+        entered, _ = self.unsafe_monitor.update(grid_counts, self.frame_idx)
+        for gx, gy in entered:
+            live_alerts.append({"id": f"live-dense-{gx}-{gy}", "type": "High Risk Detected", "message": f"Congestion in {get_zone_name(gx, gy, self.GRID_SIZE)}"})
+
+        track_overlays = update_track_overlays(frame_tracks, self.track_history)
         total_count = len(frame_tracks)
-        cv2.putText(vis, f"Total Count: {total_count}", (40, frame_h - 40), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0,0,0), 6)
-        cv2.putText(vis, f"Total Count: {total_count}", (40, frame_h - 40), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255,255,255), 2)
+        with self.timings.time("draw"):
+            vis = self.renderer.render(frame, grid_counts, self.GRID_SIZE, track_overlays, total_count)
+        self.scheduler.frame_done(self.renderer.last_render_ms, total_count, bool(entered))
         
-        analysis_data = {"total_count": total_count, "alerts": live_alerts}
+        analysis_data = {"total_count": total_count, "alerts": live_alerts, "analysis_rate": self.scheduler.stats()}
+
+        # The forecast is O(cells) per call, so the risk outlook goes out with every analyzed frame.
+        prediction_results = predict_future_heatmap(self.forecaster, video_fps)
+        if prediction_results and analyzed:
+            analysis_data['risk_forecast'] = {
+                "expected_risk_level": "High" if prediction_results["high_risk_zones"] else "Low",
+                "expected_max_density": prediction_results["expected_max_density"], "high_risk_zones": prediction_results["high_risk_zones"],
+            }
         
+        if now - self.last_heatmap_time >= LIVE_HEATMAP_INTERVAL_SECONDS:
+            self.last_heatmap_time = now
+            # Low-res decayed map: cheap enough to refresh every second. Left as an image so the
+            # transport layer encodes it once per viewer setting.
+            with self.timings.time("heatmap"):
+                live_heatmap_img = self.live_heatmap.render()
+            if live_heatmap_img is not None:
+                analysis_data['liveHeatmap'] = live_heatmap_img
+
         if self.frame_idx % 50 == 0:
-            if np.any(self.heatmap_acc):
-                heatmap_blurred = gaussian_filter(self.heatmap_acc, sigma=20)
-                vmax = np.percentile(heatmap_blurred, 99.9)
-                if vmax > 0:
-                    hm_norm = (255 * np.clip(heatmap_blurred, 0, vmax) / vmax).astype(np.uint8)
-                    hm_color = cv2.applyColorMap(hm_norm, cv2.COLORMAP_JET)
-                    _, buffer = cv2.imencode('.png', hm_color)
-                    analysis_data['liveHeatmap'] = f"data:image/png;base64,{base64.b64encode(buffer).decode('utf-8')}"
-
-            prediction_results = predict_future_heatmap(self.grid_history, (self.GRID_SIZE, self.GRID_SIZE), video_fps)
             if prediction_results:
-                predicted_grid = prediction_results.get("predicted_grid_counts", np.zeros((self.GRID_SIZE, self.GRID_SIZE)))
-                predicted_heatmap_img = create_smooth_heatmap_overlay(predicted_grid, frame_w, frame_h, self.GRID_SIZE, self.GRID_SIZE, is_prediction=True)
-                _, buffer = cv2.imencode('.png', predicted_heatmap_img)
-                prediction_b64 = base64.b64encode(buffer).decode('utf-8')
-                risk_level = "High" if prediction_results.get("high_risk_zones") else "Low"
-                analysis_data['livePrediction'] = {"heatmap_prediction_b64": prediction_b64, "expected_risk_level": risk_level}
+                predicted_grid = prediction_results["predicted_grid_counts"]
+                with self.timings.time("prediction"):
+                    analysis_data['livePrediction'] = create_smooth_heatmap_overlay(predicted_grid, frame_w, frame_h, self.GRID_SIZE, self.GRID_SIZE, is_prediction=True)
 
             if self.live_people_counts:
                 avg_count = np.mean(self.live_people_counts)
@@ -214,147 +249,199 @@ class LiveStreamProcessor:
 
 
 # --- BATCH VIDEO PROCESSING FUNCTION ---
-def process_video(video_in_path: str):
+def calibrate_grid_size(cap, video_fps, frame_h, batch_size=INFERENCE_BATCH_SIZE):
+    # Grid size from the average person height over the first 3 seconds of the video.
+    all_person_heights = []
+    calibration_frames = int(video_fps * 3)
+    while calibration_frames > 0:
+        frames = read_frames(cap, min(batch_size, calibration_frames))
+        if not frames: break
+        calibration_frames -= len(frames)
+        for result in get_model()(frames, verbose=False):
+            data = result.boxes.data.cpu().numpy()
+            keep = (data[:, 4] > CONFIDENCE_THRESHOLD) & np.isin(data[:, 5].astype(int), model_manager.person_class_ids)
+            all_person_heights.extend(data[keep, 3] - data[keep, 1])
+
+    grid_size = DEFAULT_GRID
+    if all_person_heights:
+        avg_h = float(np.mean(all_person_heights))
+        raw_grid = int(frame_h / (avg_h * GRID_SCALE_FACTOR + 1e-8))
+        grid_size = max(GRID_MIN, min(raw_grid, GRID_MAX))
+    return grid_size
+
+def analyze_segment(video_in_path: str, grid_size: int, video_out_path: str, start_frame: int = 0, end_frame=None,
+                    warmup_frames: int = 0, batch_size: int = INFERENCE_BATCH_SIZE, progress_callback=None):
+    """Detects, tracks, renders and encodes frames [start_frame, end_frame) of a video (to the
+    end if end_frame is None). The warmup_frames before start_frame only go through the tracker,
+    so people crossing into the segment are already confirmed tracks at its first frame.
+    Returns per-frame people and grid counts, the foot-point heatmap and timing stats
+    (including per-stage latency histograms in ms per frame)."""
     cap = cv2.VideoCapture(video_in_path)
     if not cap.isOpened(): raise FileNotFoundError(f"Cannot open video: {video_in_path}")
 
     video_fps = float(cap.get(cv2.CAP_PROP_FPS) or 25.0)
     frame_w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     frame_h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    last_frame = end_frame if end_frame is not None else int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    expected_frames = max(0, last_frame - start_frame)
+
+    first_frame = max(0, start_frame - warmup_frames)
+    warmup_frames = start_frame - first_frame
+    if first_frame: cap.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
+    frames_to_read = None if end_frame is None else end_frame - first_frame
+
+    out = open_video_writer(video_out_path, video_fps, (frame_w, frame_h))
+
+    heatmap_acc, people_counts_per_frame, grid_counts_per_frame = np.zeros((frame_h, frame_w), dtype=np.float32), [], GridCountSeries(grid_size, expected_frames)
+    track_history = {}
+    frames_seen = 0
+
+    batch_tracker = create_tracker()
+    renderer = OverlayRenderer(CELL_DENSITY_THRESHOLD)
+    timings = StageTimer()
+
+    # Streaming pipeline: decode -> batched inference -> tracking (sequential, this thread)
+    # -> rendering pool -> encoder. Bounded queues between stages provide backpressure.
+    pipeline = StagePipeline()
+    decoded_q, inferred_q, rendered_q = pipeline.queue(), pipeline.queue(), pipeline.queue(RENDER_WORKERS * 2)
+
+    def decode_stage():
+        remaining = frames_to_read
+        while remaining is None or remaining > 0:
+            start = time.perf_counter()
+            frames = read_frames(cap, batch_size if remaining is None else min(batch_size, remaining))
+            timings.observe_batch("decode", (time.perf_counter() - start) * 1000, len(frames))
+            if not frames: break
+            if remaining is not None: remaining -= len(frames)
+            pipeline.put(decoded_q, frames)
+        pipeline.close(decoded_q)
+
+    def inference_stage():
+        for frames in pipeline.items(decoded_q):
+            start = time.perf_counter()
+            detections = detect_people(frames)
+            timings.observe_batch("inference", (time.perf_counter() - start) * 1000, len(frames))
+            pipeline.put(inferred_q, (frames, detections))
+        pipeline.close(inferred_q)
+
+    def encode_stage():
+        # Render futures arrive in frame order, so frames are written in order.
+        for rendered in pipeline.items(rendered_q):
+            frame = rendered.result()
+            with timings.time("ffmpeg"):
+                out.write(frame)
+
+    def render_frame(*args):
+        with timings.time("draw"):
+            return renderer.render(*args)
+
+    pipeline.spawn("decode", decode_stage)
+    pipeline.spawn("inference", inference_stage)
+    pipeline.spawn("encode", encode_stage)
 
-    all_person_heights = []
-    for _ in range(int(video_fps * 3)):
-        ret, frame = cap.read()
-        if not ret: break
-        results = model(frame, verbose=False)[0]
-        for box in results.boxes:
-            if box.conf[0] > CONFIDENCE_THRESHOLD and model.names[int(box.cls[0])] == "person":
-                _, y1, _, y2 = box.xyxy[0].cpu().numpy()
-                all_person_heights.append(y2 - y1)
+    try:
+        with ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render") as render_pool:
+            try:
+                for frames, batch_detections in pipeline.items(inferred_q):
+                    for frame, detections in zip(frames, batch_detections):
+                        frames_seen += 1
+                        with timings.time("tracking"):
+                            tracks = batch_tracker.update_tracks(detections, frame=frame)
+                        frame_tracks = [tr for tr in tracks if tr.is_confirmed()]
+                        if frames_seen <= warmup_frames:
+                            # Overlap with the previous segment: only warm up tracks and their motion history.
+                            update_track_overlays(frame_tracks, track_history)
+                            continue
+                        people_counts_per_frame.append(len(frame_tracks))
+
+                        with timings.time("grid"):
+                            grid_counts = compute_grid_density(tracks_to_boxes(frame_tracks), frame_w, frame_h, grid_size, heatmap_acc)
+                            grid_counts_per_frame.append(grid_counts)
+
+                        track_overlays = update_track_overlays(frame_tracks, track_history)
+                        pipeline.put(rendered_q, render_pool.submit(render_frame, frame, grid_counts, grid_size, track_overlays, len(frame_tracks)))
+                        frames_done = len(people_counts_per_frame)
+                        if progress_callback and frames_done % PROGRESS_REPORT_INTERVAL == 0:
+                            progress_callback(frames_done, max(expected_frames, frames_done))
+                pipeline.close(rendered_q)
+            except PipelineAborted:
+                pass
+            except BaseException:
+                pipeline.abort()
+                raise
+            finally:
+                pipeline.join()
+    except BaseException:
+        out.abort()
+        raise
+    finally:
+        cap.release()
+
+    out.close()
+    return {
+        "people_counts": people_counts_per_frame, "heatmap_acc": heatmap_acc,
+        "grid_counts": grid_counts_per_frame.array(),
+        "encoder": out.backend, "encode_seconds": out.encode_seconds,
+        "render_ms_total": renderer.total_render_ms, "render_cache_hits": renderer.cache_hits,
+        "stage_ms": timings.snapshot(),
+    }
 
-    GRID_SIZE = DEFAULT_GRID
-    if all_person_heights:
-        avg_h = float(np.mean(all_person_heights))
-        raw_grid = int(frame_h / (avg_h * GRID_SCALE_FACTOR + 1e-8))
-        GRID_SIZE = max(GRID_MIN, min(raw_grid, GRID_MAX))
-    
+def process_video(video_in_path: str, progress_callback=None, batch_size: int = INFERENCE_BATCH_SIZE, workers: int = CHUNK_WORKERS):
+    cap = cv2.VideoCapture(video_in_path)
+    if not cap.isOpened(): raise FileNotFoundError(f"Cannot open video: {video_in_path}")
+
+    video_fps = float(cap.get(cv2.CAP_PROP_FPS) or 25.0)
+    frame_w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+
+    try:
+        GRID_SIZE = calibrate_grid_size(cap, video_fps, frame_h, batch_size)
+    finally:
+        cap.release()
     logger.info(f"Dynamic grid size calculated: {GRID_SIZE}x{GRID_SIZE}")
-    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
 
     unique_id = uuid.uuid4().hex
     video_out_path = os.path.join("outputs", f"output_{unique_id}.mp4")
     heatmap_out_path = os.path.join("outputs", f"heatmap_{unique_id}.png")
-    
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(video_out_path, fourcc, video_fps, (frame_w, frame_h))
-    
-    heatmap_acc, unsafe_active, unsafe_events, people_counts_per_frame = np.zeros((frame_h, frame_w), dtype=np.float32), {}, [], []
-    grid_history, track_history = deque(maxlen=PREDICTION_HISTORY_FRAMES), {}
-    grid_counts_over_time = []
-    frame_idx = 0
-    
-    batch_tracker = DeepSort(max_age=30)
-
-    while True:
-        ret, frame = cap.read()
-        if not ret: break
-        frame_idx += 1
-        
-        results = model(frame, verbose=False)[0]
-        detections = [(list(map(int, b.xyxy[0].cpu().numpy())), float(b.conf), "person") for b in results.boxes if b.conf > CONFIDENCE_THRESHOLD and model.names[int(b.cls)] == "person"]
-        
-        tracks = batch_tracker.update_tracks(detections, frame=frame)
-        frame_tracks = [tr for tr in tracks if tr.is_confirmed()]
-        people_counts_per_frame.append(len(frame_tracks))
-        
-        vis = frame.copy()
-        
-        cell_w, cell_h = max(1, frame_w // GRID_SIZE), max(1, frame_h // GRID_SIZE)
-        grid_counts = np.zeros((GRID_SIZE, GRID_SIZE), dtype=int)
-        for tr in frame_tracks:
-            x1, y1, x2, y2 = map(int, tr.to_tlbr())
-            cx = (x1 + x2) // 2
-            cy = y1 + int((y2 - y1) * 0.8)
-            if 0 <= cx < frame_w and 0 <= cy < frame_h:
-                gx, gy = min(cx // cell_w, GRID_SIZE - 1), min(cy // cell_h, GRID_SIZE - 1)
-                grid_counts[gy, gx] += 1
-                heatmap_acc[cy, cx] += 1.0
-
-        grid_history.append(grid_counts)
-        grid_counts_over_time.append(grid_counts.tolist())
-        
-        heatmap_overlay = create_smooth_heatmap_overlay(grid_counts, frame_w, frame_h, GRID_SIZE, GRID_SIZE)
-        cv2.addWeighted(heatmap_overlay, 0.4, vis, 0.6, 0, vis)
-
-        for gy in range(GRID_SIZE):
-            for gx in range(GRID_SIZE):
-                count = int(grid_counts[gy, gx])
-                is_unsafe = count >= CELL_DENSITY_THRESHOLD
-                if is_unsafe:
-                    if (gx, gy) not in unsafe_active: unsafe_active[(gx, gy)] = frame_idx
-                elif (gx, gy) in unsafe_active:
-                    start_f = unsafe_active.pop((gx, gy))
-                    if (frame_idx - start_f) / video_fps >= UNSAFE_DURATION:
-                        unsafe_events.append(((gx, gy), start_f / video_fps, frame_idx / video_fps))
-                
-                color = (0, 0, 255) if is_unsafe else (0, 200, 0)
-                cv2.rectangle(vis, (gx * cell_w, gy * cell_h), (gx * cell_w + cell_w, gy * cell_h + cell_h), color, 1)
-
-                text_pos = (gx * cell_w + 5, gy * cell_h + 20)
-                cv2.putText(vis, str(count), text_pos, cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,0,0), 4)
-                cv2.putText(vis, str(count), text_pos, cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-        
-        current_track_ids = set()
-        for tr in frame_tracks:
-            if tr.track_id is not None:
-                current_track_ids.add(tr.track_id)
-                x1, y1, x2, y2 = map(int, tr.to_tlbr())
-                
-                if tr.get_det_conf() is not None:
-                    label = f"P: {tr.get_det_conf():.2f}"
-                    cv2.rectangle(vis, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    (w, h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-                    cv2.rectangle(vis, (x1, y1 - h - 10), (x1 + w, y1 - 5), (0, 255, 0), cv2.FILLED)
-                    cv2.putText(vis, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                
-                center_x, center_y = (x1 + x2) // 2, y1 + int((y2 - y1) * 0.8)
-                if tr.track_id not in track_history: track_history[tr.track_id] = deque(maxlen=15)
-                track_history[tr.track_id].append((center_x, center_y))
-                
-                if len(track_history[tr.track_id]) > 10:
-                    history = track_history[tr.track_id]
-                    dx, dy = history[-1][0] - history[0][0], history[-1][1] - history[0][1]
-                    magnitude = np.sqrt(dx**2 + dy**2)
-                    if magnitude > 5:
-                        arrow_color = (0, 255, 0)
-                        if magnitude > SPEED_THRESHOLD_HIGH: arrow_color = (0, 0, 255)
-                        elif magnitude > SPEED_THRESHOLD_LOW: arrow_color = (0, 255, 255)
-
-                        norm_dx, norm_dy = dx / magnitude, dy / magnitude
-                        end_point = (center_x + int(norm_dx * 15), center_y + int(norm_dy * 15))
-                        cv2.arrowedLine(vis, (center_x, center_y), end_point, arrow_color, 2, tipLength=0.5)
-
-        for track_id in list(track_history.keys()):
-            if track_id not in current_track_ids: del track_history[track_id]
-        
-        total_count = len(frame_tracks)
-        cv2.putText(vis, f"Total Count: {total_count}", (40, frame_h - 40), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0,0,0), 6)
-        cv2.putText(vis, f"Total Count: {total_count}", (40, frame_h - 40), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255,255,255), 2)
-        out.write(vis)
-
-    cap.release(), out.release()
-    logger.info(f"Raw video processing complete. Saved to {video_out_path}")
-
-    temp_video_path = video_out_path.replace(".mp4", "_temp_final.mp4")
-    os.rename(video_out_path, temp_video_path)
-    logger.info("Running ffmpeg to optimize video for web streaming...")
-    try:
-        ffmpeg_command = ["ffmpeg","-y","-i",temp_video_path,"-c:v","libx264","-preset","veryfast","-pix_fmt","yuv420p","-movflags","+faststart",video_out_path]
-        subprocess.run(ffmpeg_command, check=True, capture_output=True, text=True)
-        os.remove(temp_video_path)
-    except Exception as e:
-        logger.error(f"FFmpeg failed: {e}")
-        os.rename(temp_video_path, video_out_path)
+    grid_counts_out_path = os.path.join("outputs", f"grid_counts_{unique_id}.npy")
+    processing_start = time.time()
+
+    # Long videos can be split into time segments analyzed by separate worker processes.
+    segment_bounds = plan_segments(total_frames, video_fps, workers)
+    if len(segment_bounds) == 1:
+        segments = [analyze_segment(video_in_path, GRID_SIZE, video_out_path, batch_size=batch_size, progress_callback=progress_callback)]
+        encoder_backend = segments[0]["encoder"]
+    else:
+        segments, encoder_backend = run_segments(video_in_path, GRID_SIZE, video_out_path, segment_bounds, video_fps, (frame_w, frame_h),
+                                                 batch_size, TRACKER_MAX_AGE, total_frames, progress_callback)
+
+    # --- Stitch the segments back together ---
+    people_counts_per_frame = [count for segment in segments for count in segment["people_counts"]]
+    grid_counts_seq = np.concatenate([segment["grid_counts"] for segment in segments])
+    heatmap_acc = np.sum([segment["heatmap_acc"] for segment in segments], axis=0)
+    encode_seconds = sum(segment["encode_seconds"] for segment in segments)
+    render_ms_total = sum(segment["render_ms_total"] for segment in segments)
+    render_cache_hits = sum(segment["render_cache_hits"] for segment in segments)
+    stage_timings = StageTimer()
+    for segment in segments:
+        stage_timings.merge(segment["stage_ms"])
+    frame_idx = len(people_counts_per_frame)
+
+    if progress_callback: progress_callback(frame_idx, frame_idx)
+    processing_seconds = time.time() - processing_start
+    processing_fps = frame_idx / processing_seconds if processing_seconds > 0 else 0.0
+    render_ms_per_frame = render_ms_total / frame_idx if frame_idx else 0.0
+    logger.info(f"Video processing complete: {frame_idx} frames at {processing_fps:.1f} fps ({len(segments)} segment(s), batch size {batch_size}, "
+                f"{encoder_backend} encoder {encode_seconds:.2f}s, render {render_ms_per_frame:.1f}ms/frame). Saved to {video_out_path}")
+
+    # Unsafe events are found over the whole merged timeline, so events spanning a segment boundary stay whole.
+    unsafe_monitor, unsafe_events = UnsafeCellMonitor(CELL_DENSITY_THRESHOLD), []
+    for idx, grid_counts in enumerate(grid_counts_seq, start=1):
+        _, cleared = unsafe_monitor.update(grid_counts, idx)
+        for (gx, gy), start_f in cleared:
+            if (idx - start_f) / video_fps >= UNSAFE_DURATION:
+                unsafe_events.append(((gx, gy), start_f / video_fps, idx / video_fps))
 
     people_count_by_second = []
     if people_counts_per_frame and video_fps > 0:
@@ -362,11 +449,15 @@ def process_video(video_in_path: str):
             chunk = people_counts_per_frame[i:i + int(video_fps)]
             if chunk: people_count_by_second.append({"second": i // int(video_fps), "count": round(np.mean(chunk), 2)})
 
-    for (gx, gy), start_f in list(unsafe_active.items()):
+    for (gx, gy), start_f in unsafe_monitor.active():
         if (frame_idx - start_f) / video_fps >= UNSAFE_DURATION:
             unsafe_events.append(((gx, gy), start_f / video_fps, frame_idx / video_fps))
 
-    prediction_results = predict_future_heatmap(grid_history, (GRID_SIZE, GRID_SIZE), video_fps)
+    # Only the trend over the last PREDICTION_HISTORY_FRAMES grids feeds the forecast.
+    forecaster = DensityForecaster(PREDICTION_HISTORY_FRAMES)
+    for grid_counts in grid_counts_seq[-PREDICTION_HISTORY_FRAMES:]:
+        forecaster.update(grid_counts)
+    prediction_results = predict_future_heatmap(forecaster, video_fps)
     final_prediction_data = {"prediction_horizon": f"{PREDICTION_HORIZON_SECONDS}s", "high_risk_zones": [], "expected_risk_level": "Low", "expected_max_density": 0, "heatmap_prediction_b64": None}
     predicted_grid_for_heatmap = np.zeros((GRID_SIZE, GRID_SIZE))
 
@@ -378,12 +469,14 @@ def process_video(video_in_path: str):
     _, buffer = cv2.imencode('.png', predicted_heatmap_img)
     final_prediction_data["heatmap_prediction_b64"] = base64.b64encode(buffer).decode('utf-8')
 
+    # Always written (blank without detections): the result, and the cache entry holding it, points to this file.
+    hm_norm = np.zeros((frame_h, frame_w), dtype=np.uint8)
     if np.any(heatmap_acc):
         heatmap_blurred = gaussian_filter(heatmap_acc, sigma=20)
         vmax = np.percentile(heatmap_blurred, 99.9)
         if vmax > 0:
             hm_norm = (255 * np.clip(heatmap_blurred, 0, vmax) / vmax).astype(np.uint8)
-            cv2.imwrite(heatmap_out_path, cv2.applyColorMap(hm_norm, cv2.COLORMAP_JET))
+    cv2.imwrite(heatmap_out_path, cv2.applyColorMap(hm_norm, cv2.COLORMAP_JET))
     
     unsafe_report = [{"id": f"unsafe-{i}", "type": "High Risk Event", "message": f"High density in {get_zone_name(gx, gy, GRID_SIZE)} (Grid {gx},{gy}) from {start_t:.1f}s to {end_t:.1f}s"} for i, ((gx, gy), start_t, end_t) in enumerate(unsafe_events)]
     
@@ -392,7 +485,12 @@ def process_video(video_in_path: str):
     return {
         "processed_video_url": video_out_path.replace("\\", "/"), "heatmap_image_url": heatmap_out_path.replace("\\", "/"),
         "alerts": unsafe_report, "summary": summary, "prediction": final_prediction_data,
-        "people_count_by_second": people_count_by_second, "grid_counts_over_time": grid_counts_over_time,
-        "grid_dimensions": {"rows": GRID_SIZE, "cols": GRID_SIZE}
+        "people_count_by_second": people_count_by_second,
+        "grid_counts_url": save_grid_counts(grid_counts_out_path, grid_counts_seq).replace("\\", "/"), "grid_counts_frames": frame_idx, "video_fps": video_fps,
+        "grid_dimensions": {"rows": GRID_SIZE, "cols": GRID_SIZE},
+        "performance": {"frames_processed": frame_idx, "processing_seconds": round(processing_seconds, 2), "processing_fps": round(processing_fps, 2), "inference_batch_size": batch_size,
+                        "segments": len(segments), "encoder": encoder_backend, "encode_seconds": round(encode_seconds, 2),
+                        "render_ms_per_frame": round(render_ms_per_frame, 2), "render_cache_hits": render_cache_hits,
+                        "stage_ms": stage_timings.snapshot()}
     }
 
@@ -0,0 +1,350 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import platform
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+from metrics import StageTimer, histogram_quantile
+
+# Offline benchmark for process_video and LiveStreamProcessor.analyze_frame:
+#
+#   python benchmark.py --stub --save baseline.json     # synthetic clips, stub detector + tracker
+#   python benchmark.py --stub --compare baseline.json  # exits 1 if any case got slower
+#   python benchmark.py --clips samples/dense.mp4       # the real model on a sample clip
+#
+# Every case runs in a fresh process, so its peak memory is its own and the model load is
+# not timed. With --stub the detector and tracker are deterministic stand-ins, so two runs do
+# the same work and differ only in how fast it was done.
+
+# --- SETTINGS ---
+BENCHMARK_RESOLUTIONS = {"480p": (854, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+BENCHMARK_DENSITIES = {"sparse": 8, "dense": 60}   # People walking around a synthetic clip
+SYNTHETIC_SECONDS = 8
+SYNTHETIC_FPS = 25
+BENCHMARK_DIR = "benchmark_runs"                    # Synthetic clips and analysis outputs go here
+STUB_FRAME_SKIP = 2                                 # Fixed live frame skip with --stub (no adaptive scheduling)
+STUB_TRACK_CONFIRM_HITS = 3
+REGRESSION_TOLERANCE = 0.10                         # Slowdown --compare accepts before failing
+
+
+# --- SYNTHETIC CLIPS ---
+def make_synthetic_clip(path, width, height, people, seconds=SYNTHETIC_SECONDS, fps=SYNTHETIC_FPS, seed=0):
+    """Writes a clip of bright rectangles ("people") walking over a dark textured background.
+    The same arguments always produce the same clip."""
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(rng.integers(30, 120, (height, width), dtype=np.uint8), (0, 0), 3)
+    background = cv2.cvtColor(background, cv2.COLOR_GRAY2BGR)
+    person_h = max(8, height // 8)
+    person_w = max(4, int(person_h * 0.4))
+    position = rng.uniform([0, 0], [width - person_w, height - person_h], (people, 2))
+    velocity = rng.uniform(-1, 1, (people, 2)) * person_h / fps  # up to one body height per second
+
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    try:
+        for _ in range(int(seconds * fps)):
+            frame = background.copy()
+            for x, y in position.astype(int):
+                cv2.rectangle(frame, (x, y), (x + person_w, y + person_h), (235, 235, 235), -1)
+            out.write(frame)
+            position += velocity
+            # Bounce off the edges so the crowd stays in frame.
+            for axis, limit in ((0, width - person_w), (1, height - person_h)):
+                outside = (position[:, axis] < 0) | (position[:, axis] > limit)
+                velocity[outside, axis] *= -1
+                position[:, axis] = np.clip(position[:, axis], 0, limit)
+    finally:
+        out.release()
+    return path
+
+
+# --- STUB DETECTOR AND TRACKER ---
+class _StubTensor:
+    def __init__(self, array): self.array = array
+    def cpu(self): return self
+    def numpy(self): return self.array
+
+
+class _StubBoxes:
+    def __init__(self, data): self.data = _StubTensor(data)
+
+
+class _StubResult:
+    def __init__(self, data): self.boxes = _StubBoxes(data)
+
+
+class StubDetector:
+    """Stands in for the YOLO model (same call and result shape as far as analysis.py
+    looks): every bright blob is a person with confidence 0.9. Deterministic, and needs no weights."""
+
+    names = {0: "person"}
+
+    def __call__(self, frames, verbose=False, **kwargs):
+        if not isinstance(frames, list): frames = [frames]
+        return [_StubResult(self._detect(frame)) for frame in frames]
+
+    @staticmethod
+    def _detect(frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        _, _, stats, _ = cv2.connectedComponentsWithStats((gray > 200).astype(np.uint8))
+        blobs = stats[1:][stats[1:, cv2.CC_STAT_AREA] > 20]
+        data = np.zeros((len(blobs), 6), dtype=np.float32)
+        data[:, 0], data[:, 1] = blobs[:, cv2.CC_STAT_LEFT], blobs[:, cv2.CC_STAT_TOP]
+        data[:, 2] = blobs[:, cv2.CC_STAT_LEFT] + blobs[:, cv2.CC_STAT_WIDTH]
+        data[:, 3] = blobs[:, cv2.CC_STAT_TOP] + blobs[:, cv2.CC_STAT_HEIGHT]
+        data[:, 4] = 0.9
+        return data
+
+
+class StubTrack:
+    def __init__(self, track_id, box, conf):
+        self.track_id = track_id
+        self.box, self.conf = box, conf
+        self.hits = 1
+        self.time_since_update = 0
+
+    def is_confirmed(self):
+        return self.hits >= STUB_TRACK_CONFIRM_HITS
+
+    def to_tlbr(self):
+        # Boxes are read as [left, top, width, height], the way DeepSort reads them.
+        left, top, w, h = self.box
+        return [left, top, left + w, top + h]
+
+    def get_det_conf(self):
+        return self.conf if self.time_since_update == 0 else None
+
+
+class StubTracker:
+    """Stands in for DeepSort: greedy nearest-centre matching instead of a Kalman filter
+    and appearance embeddings, with the same update_tracks() call and track interface."""
+
+    def __init__(self, max_age=30, max_distance=50.0):
+        self.max_age = max_age
+        self.max_distance = max_distance
+        self.tracks = []
+        self._next_id = 1
+
+    def update_tracks(self, detections, frame=None):
+        boxes = np.array([box for box, _, _ in detections], dtype=np.float64).reshape(-1, 4)
+        centres = boxes[:, :2] + boxes[:, 2:] / 2
+        unmatched = set(range(len(detections)))
+        for track in self.tracks:
+            track.time_since_update += 1
+        if self.tracks and len(detections):
+            track_centres = np.array([[t.box[0] + t.box[2] / 2, t.box[1] + t.box[3] / 2] for t in self.tracks])
+            distances = np.linalg.norm(track_centres[:, None, :] - centres[None, :, :], axis=2)
+            used_tracks = set()
+            for ti, di in zip(*np.unravel_index(np.argsort(distances, axis=None), distances.shape)):
+                if distances[ti, di] > self.max_distance: break
+                if ti in used_tracks or di not in unmatched: continue
+                track = self.tracks[ti]
+                track.box, track.conf = list(boxes[di]), detections[di][1]
+                track.hits += 1
+                track.time_since_update = 0
+                used_tracks.add(ti)
+                unmatched.discard(di)
+        for di in sorted(unmatched):
+            self.tracks.append(StubTrack(str(self._next_id), list(boxes[di]), detections[di][1]))
+            self._next_id += 1
+        self.tracks = [t for t in self.tracks if t.time_since_update <= self.max_age]
+        return self.tracks
+
+
+class FixedFrameScheduler:
+    """Analyzes one frame in every (skip + 1), whatever the timings, so stub runs are repeatable."""
+
+    def __init__(self, skip):
+        self.skip = skip
+        self.frames_since_analysis = skip
+
+    def should_analyze(self):
+        return self.frames_since_analysis >= self.skip
+
+    def record_analysis(self, elapsed_ms):
+        self.frames_since_analysis = 0
+
+    def frame_done(self, render_ms, total_count, new_alerts):
+        self.frames_since_analysis += 1
+
+    def stats(self):
+        return {"analysis_rate": 0.0, "frame_skip": self.skip, "urgent": False, "analysis_ms": 0.0, "render_ms": 0.0}
+
+
+# --- CASES (each runs in its own process) ---
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _stage_summary(snapshot):
+    return {stage: {"mean_ms": h["mean"], "p50_ms": round(histogram_quantile(h, 0.5), 3), "p95_ms": round(histogram_quantile(h, 0.95), 3)}
+            for stage, h in snapshot.items()}
+
+
+def _run_batch(analysis, clip_path):
+    start = time.perf_counter()
+    result = analysis.process_video(clip_path, workers=1)
+    seconds = time.perf_counter() - start
+    frames = result["performance"]["frames_processed"]
+    with open(result["grid_counts_url"], "rb") as f:
+        checksum = hashlib.sha256(f.read()).hexdigest()[:16]
+    for key in ("processed_video_url", "heatmap_image_url", "grid_counts_url"):
+        if os.path.exists(result[key]): os.remove(result[key])
+    return {"frames": frames, "seconds": round(seconds, 3), "fps": round(frames / seconds, 2) if seconds else 0.0,
+            "stages": _stage_summary(result["performance"]["stage_ms"]), "checksum": checksum}
+
+
+def _run_live(analysis, clip_path, stub):
+    timings = StageTimer()
+    processor = analysis.LiveStreamProcessor(timings=timings)
+    if stub: processor.scheduler = FixedFrameScheduler(STUB_FRAME_SKIP)
+    cap = cv2.VideoCapture(clip_path)
+    latencies, digest = [], hashlib.sha256()
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret: break
+            start = time.perf_counter()
+            _, analysis_data = processor.analyze_frame(frame)
+            latencies.append((time.perf_counter() - start) * 1000)
+            digest.update(json.dumps([analysis_data["total_count"], analysis_data["grid_counts"]]).encode())
+    finally:
+        cap.release()
+    seconds = sum(latencies) / 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    return {"frames": len(latencies), "seconds": round(seconds, 3), "fps": round(len(latencies) / seconds, 2) if seconds else 0.0,
+            "frame_ms": {"p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3)},
+            "stages": _stage_summary(timings.snapshot()), "checksum": digest.hexdigest()[:16]}
+
+
+def _run_case(path, clip_path, stub, work_dir):
+    import analysis
+    logging.getLogger().setLevel(logging.WARNING)
+    clip_path = os.path.abspath(clip_path)
+    if stub:
+        analysis.set_model(StubDetector())
+        analysis.create_tracker = StubTracker
+    else:
+        # Load and warm up the model before the clock starts.
+        cap = cv2.VideoCapture(clip_path)
+        ret, frame = cap.read()
+        cap.release()
+        if ret: analysis.detect_people([frame])
+    os.chdir(work_dir)
+    os.makedirs("outputs", exist_ok=True)
+    result = _run_batch(analysis, clip_path) if path == "batch" else _run_live(analysis, clip_path, stub)
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+# --- DRIVER ---
+def environment(stub):
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "opencv": cv2.__version__, "numpy": np.__version__, "detector": "stub" if stub else "yolo"}
+
+
+def build_clips(args, clip_dir):
+    clips = {}
+    if not args.clips_only:
+        os.makedirs(clip_dir, exist_ok=True)
+        for resolution in args.resolutions:
+            width, height = BENCHMARK_RESOLUTIONS[resolution]
+            for density in args.densities:
+                name = f"{resolution}-{density}"
+                path = os.path.join(clip_dir, f"synthetic_{name}_{args.seconds}s.mp4")
+                if not os.path.exists(path):
+                    make_synthetic_clip(path, width, height, BENCHMARK_DENSITIES[density], args.seconds)
+                clips[name] = path
+    for path in args.clips:
+        clips[os.path.splitext(os.path.basename(path))[0]] = path
+    return clips
+
+
+def run_benchmark(args):
+    work_dir = os.path.abspath(args.work_dir)
+    clips = build_clips(args, os.path.join(work_dir, "clips"))
+    results = {}
+    ctx = multiprocessing.get_context("spawn")
+    for name, clip_path in clips.items():
+        for path in args.paths:
+            case = f"{path}/{name}"
+            runs = []
+            for _ in range(args.repeats):
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                    runs.append(pool.submit(_run_case, path, clip_path, args.stub, work_dir).result())
+            # Like timeit, keep the fastest run: slower ones mostly measure other load on the machine.
+            r = results[case] = max(runs, key=lambda run: run["fps"])
+            print(f"{case:<24} {r['frames']:>5} frames  {r['fps']:>8.2f} fps  peak {r['peak_rss_mb']} MB  "
+                  + "  ".join(f"{stage} {s['mean_ms']:.2f}" for stage, s in r["stages"].items()), flush=True)
+    return {"environment": environment(args.stub), "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}
+
+
+def compare(report, baseline, tolerance):
+    """Prints FPS and per-stage changes against a baseline report. Returns the cases that
+    got slower by more than `tolerance`."""
+    regressions = []
+    if baseline["environment"] != report["environment"]:
+        print("Note: baseline was recorded in a different environment; timings may not be comparable.")
+    for case, current in report["results"].items():
+        previous = baseline["results"].get(case)
+        if previous is None:
+            print(f"{case:<24} new case, no baseline")
+            continue
+        change = current["fps"] / previous["fps"] - 1 if previous["fps"] else 0.0
+        flag = "SLOWER" if change < -tolerance else ""
+        if flag: regressions.append(case)
+        print(f"{case:<24} {previous['fps']:>8.2f} -> {current['fps']:>8.2f} fps ({change:+.1%}) {flag}")
+        if current["checksum"] != previous["checksum"]:
+            print(f"{'':<24} output differs from the baseline run (checksum {previous['checksum']} -> {current['checksum']})")
+        for stage, s in current["stages"].items():
+            before = previous["stages"].get(stage, {}).get("mean_ms")
+            if before and abs(s["mean_ms"] / before - 1) > tolerance:
+                print(f"{'':<24} {stage}: {before:.2f} -> {s['mean_ms']:.2f} ms/frame")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the batch (process_video) and live (analyze_frame) analysis paths.")
+    parser.add_argument("--stub", action="store_true", help="Use the deterministic stub detector and tracker instead of YOLO + DeepSort.")
+    parser.add_argument("--resolutions", type=lambda s: s.split(","), default=list(BENCHMARK_RESOLUTIONS), help="Synthetic clip sizes, e.g. 480p,1080p.")
+    parser.add_argument("--densities", type=lambda s: s.split(","), default=list(BENCHMARK_DENSITIES), help="Synthetic crowd densities, e.g. sparse,dense.")
+    parser.add_argument("--seconds", type=int, default=SYNTHETIC_SECONDS, help="Length of each synthetic clip.")
+    parser.add_argument("--clips", nargs="*", default=[], help="Extra video files to benchmark, e.g. sample clips.")
+    parser.add_argument("--clips-only", action="store_true", help="Skip the synthetic clips.")
+    parser.add_argument("--paths", type=lambda s: s.split(","), default=["batch", "live"], help="batch, live or both.")
+    parser.add_argument("--repeats", type=int, default=1, help="Runs per case; the fastest is reported.")
+    parser.add_argument("--work-dir", default=BENCHMARK_DIR)
+    parser.add_argument("--save", help="Write the report as a JSON baseline to this file.")
+    parser.add_argument("--compare", help="Compare against a baseline written by --save; exit 1 on a regression.")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args(argv)
+    for value, allowed in ((args.resolutions, BENCHMARK_RESOLUTIONS), (args.densities, BENCHMARK_DENSITIES), (args.paths, ("batch", "live"))):
+        unknown = set(value) - set(allowed)
+        if unknown: parser.error(f"unknown value(s) {', '.join(sorted(unknown))}; choose from {', '.join(allowed)}")
+
+    report = run_benchmark(args)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
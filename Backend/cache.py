@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from jobs import JOB_RETENTION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# --- SETTINGS ---
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "cache")
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_MB", 2048)) * 1024 * 1024  # Results + their output files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _output_files(result):
+    return [result[k] for k in ("processed_video_url", "heatmap_image_url", "grid_counts_url") if result.get(k)]
+
+
+class ResultCache:
+    """process_video results on disk, keyed by the upload's content hash combined with the
+    model file and analysis settings. Each entry owns the output files its result points
+    to; the least recently used entries (and their files) are evicted past max_bytes.
+    An entry stored or served within min_age seconds is kept, as jobs holding its result
+    still link to those files (JobManager retains them for JOB_RETENTION_SECONDS)."""
+
+    def __init__(self, settings, model_path, directory=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES, min_age=JOB_RETENTION_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> bytes, least recently used first
+        self._fingerprint = None
+        self._settings = settings
+        self._model_path = model_path
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @property
+    def fingerprint(self):
+        # Hashing the model file takes a moment, so it is done once, on first use.
+        if self._fingerprint is None:
+            digest = hashlib.sha256(json.dumps(self._settings, sort_keys=True).encode())
+            digest.update(file_sha256(self._model_path).encode())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def key(self, upload_sha256):
+        return hashlib.sha256(f"{upload_sha256}:{self.fingerprint}".encode()).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"): continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    entry = json.load(f)
+                entries.append((os.path.getmtime(path), name[:-len(".json")], entry["bytes"]))
+            except (OSError, ValueError, KeyError):
+                logger.warning(f"Ignoring unreadable cache entry {path}")
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+        logger.info(f"Result cache: {len(self._entries)} entries, {self.total_bytes / 1e6:.1f} MB in {self.directory}")
+
+    @property
+    def total_bytes(self):
+        return sum(self._entries.values())
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                try:
+                    with open(self._entry_path(key)) as f:
+                        result = json.load(f)["result"]
+                    if all(os.path.exists(path) for path in _output_files(result)):
+                        self._entries.move_to_end(key)
+                        os.utime(self._entry_path(key))  # Recency survives restarts
+                        self.hits += 1
+                        return result
+                except (OSError, ValueError, KeyError):
+                    pass
+                # Entry or one of its outputs went missing; forget it, with whatever outputs it still owns.
+                self._remove(key, delete_outputs=True)
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        size = len(json.dumps(result)) + sum(os.path.getsize(path) for path in _output_files(result) if os.path.exists(path))
+        with self._lock:
+            temp_path = f"{self._entry_path(key)}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump({"created_at": time.time(), "bytes": size, "result": result}, f)
+            os.replace(temp_path, self._entry_path(key))
+            self._entries[key] = size
+            self._entries.move_to_end(key)
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                if self._last_used(oldest) > time.time() - self.min_age:
+                    # Entries are in recency order, so every other one is in use too; evict once they age.
+                    logger.warning(f"Result cache is over its size limit ({self.total_bytes / 1e6:.1f} MB), but all entries are still in use.")
+                    break
+                self._remove(oldest, delete_outputs=True)
+                self.evictions += 1
+
+    def _last_used(self, key):
+        # get() touches the entry file on every hit, so its mtime is the last time the result was handed out.
+        try:
+            return os.path.getmtime(self._entry_path(key))
+        except OSError:
+            return 0.0
+
+    def _remove(self, key, delete_outputs=False):
+        self._entries.pop(key, None)
+        path = self._entry_path(key)
+        try:
+            if delete_outputs:
+                with open(path) as f:
+                    for output in _output_files(json.load(f)["result"]):
+                        if os.path.exists(output): os.remove(output)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not remove the outputs of cache entry {key}: {e}")
+        try:
+            if os.path.exists(path): os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not remove cache entry {key}: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries), "bytes": self.total_bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def collect_metrics(self, out):
+        stats = self.stats()
+        out.counter("result_cache_hits_total", "Uploads answered from the result cache.", stats["hits"])
+        out.counter("result_cache_misses_total", "Uploads that needed a fresh analysis.", stats["misses"])
+        out.counter("result_cache_evictions_total", "Cache entries evicted to stay under the size limit.", stats["evictions"])
+        out.gauge("result_cache_entries", "Results currently cached.", stats["entries"])
+        out.gauge("result_cache_bytes", "Bytes used by cached results and their output files.", stats["bytes"])
@@ -0,0 +1,109 @@
+import numpy as np
+
+# --- SETTINGS ---
+FOOT_POINT_RATIO = 0.8  # Foot point sits 80% of the way down the box
+
+
+def tracks_to_boxes(frame_tracks):
+    # One (N, 4) tlbr array per frame; everything downstream works on whole arrays.
+    return np.array([tr.to_tlbr() for tr in frame_tracks], dtype=np.float64).reshape(-1, 4)
+
+
+def foot_points(boxes):
+    # astype(int64) truncates toward zero, matching int() on each coordinate.
+    x1, y1, x2, y2 = boxes.astype(np.int64).T
+    cx = (x1 + x2) // 2
+    cy = y1 + ((y2 - y1) * FOOT_POINT_RATIO).astype(np.int64)
+    return cx, cy
+
+
+def compute_grid_density(boxes, frame_w, frame_h, grid_size, heatmap_acc=None):
+    """Bins the foot point of every box into a grid_size x grid_size count grid and,
+    if heatmap_acc is given, adds one hit per foot point to it."""
+    cx, cy = foot_points(boxes)
+    inside = (cx >= 0) & (cx < frame_w) & (cy >= 0) & (cy < frame_h)
+    cx, cy = cx[inside], cy[inside]
+
+    cell_w, cell_h = max(1, frame_w // grid_size), max(1, frame_h // grid_size)
+    gx = np.minimum(cx // cell_w, grid_size - 1)
+    gy = np.minimum(cy // cell_h, grid_size - 1)
+    grid_counts = np.bincount(gy * grid_size + gx, minlength=grid_size * grid_size).reshape(grid_size, grid_size)
+
+    if heatmap_acc is not None:
+        np.add.at(heatmap_acc, (cy, cx), 1.0)
+    return grid_counts
+
+
+class UnsafeCellMonitor:
+    """Per-cell unsafe state for a density grid. Holds the frame index at which each
+    cell reached the density threshold (-1 while the cell is safe)."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.unsafe_since = None
+
+    def update(self, grid_counts, frame_idx):
+        """Returns (entered, cleared): cells that just became unsafe as [(gx, gy)], and
+        cells that just became safe again as [((gx, gy), start_frame)], both in row-major order."""
+        if self.unsafe_since is None or self.unsafe_since.shape != grid_counts.shape:
+            # Grid was resized: previous cell coordinates no longer mean anything.
+            self.unsafe_since = np.full(grid_counts.shape, -1, dtype=np.int64)
+
+        unsafe = grid_counts >= self.threshold
+        active = self.unsafe_since >= 0
+        entered_mask, cleared_mask = unsafe & ~active, ~unsafe & active
+
+        entered_gy, entered_gx = np.nonzero(entered_mask)
+        cleared_gy, cleared_gx = np.nonzero(cleared_mask)
+        cleared_start = self.unsafe_since[cleared_gy, cleared_gx]
+
+        self.unsafe_since[entered_mask] = frame_idx
+        self.unsafe_since[cleared_mask] = -1
+
+        entered = list(zip(entered_gx.tolist(), entered_gy.tolist()))
+        cleared = [((gx, gy), start_f) for gx, gy, start_f in zip(cleared_gx.tolist(), cleared_gy.tolist(), cleared_start.tolist())]
+        return entered, cleared
+
+    def active(self):
+        """Currently unsafe cells as [((gx, gy), start_frame)], oldest first."""
+        if self.unsafe_since is None: return []
+        gy, gx = np.nonzero(self.unsafe_since >= 0)
+        start = self.unsafe_since[gy, gx]
+        order = np.lexsort((gx, gy, start))
+        return [((int(gx[i]), int(gy[i])), int(start[i])) for i in order]
+
+
+class DensityForecaster:
+    """Per-cell linear density trend over the last `history` grids, kept in a ring buffer.
+    The mean of consecutive differences telescopes to (newest - oldest) / (n - 1), so each
+    update and forecast costs one grid's worth of work however long the history is."""
+
+    def __init__(self, history):
+        self.history = history
+        self._ring = None
+        self._count = 0  # grids written since the last reset
+
+    def update(self, grid_counts):
+        if self._ring is None or self._ring.shape[1:] != grid_counts.shape:
+            # Grid was resized: the old trend says nothing about the new cells.
+            self._ring = np.zeros((self.history,) + grid_counts.shape, dtype=np.float64)
+            self._count = 0
+        self._ring[self._count % self.history] = grid_counts
+        self._count += 1
+
+    @property
+    def ready(self):
+        return self._count >= self.history
+
+    def trend(self):
+        """Average per-frame change of every cell over the window (None until it is full)."""
+        if not self.ready: return None
+        newest = self._ring[(self._count - 1) % self.history]
+        oldest = self._ring[self._count % self.history]
+        return (newest - oldest) / (self.history - 1)
+
+    def forecast(self, frames_ahead):
+        trend = self.trend()
+        if trend is None: return None
+        predicted = self._ring[(self._count - 1) % self.history] + trend * frames_ahead
+        return np.maximum(predicted, 0)
@@ -0,0 +1,144 @@
+import os
+import time
+import shutil
+import logging
+import subprocess
+import numpy as np
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# --- SETTINGS ---
+VIDEO_ENCODER = "auto"      # "auto" (ffmpeg pipe when available), "ffmpeg-pipe" or "opencv"
+FFMPEG_PRESET = "veryfast"
+FFMPEG_BIN = shutil.which("ffmpeg")
+
+
+class FFmpegPipeWriter:
+    """Pipes raw BGR frames into a single ffmpeg process that writes web-ready
+    (H.264, yuv420p, faststart) MP4 in one pass."""
+
+    backend = "ffmpeg-pipe"
+
+    def __init__(self, path, fps, frame_size):
+        width, height = frame_size
+        self.path = path
+        self.encode_seconds = 0.0
+        command = [
+            FFMPEG_BIN, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps}", "-i", "-",
+            "-an", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",  # yuv420p needs even dimensions
+            "-c:v", "libx264", "-preset", FFMPEG_PRESET, "-pix_fmt", "yuv420p", "-movflags", "+faststart", path,
+        ]
+        self._proc = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write(self, frame):
+        start = time.perf_counter()
+        try:
+            self._proc.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            raise RuntimeError(f"ffmpeg exited while encoding: {self._stderr()}")
+        self.encode_seconds += time.perf_counter() - start
+
+    def close(self):
+        start = time.perf_counter()
+        self._proc.stdin.close()
+        returncode = self._proc.wait()
+        self.encode_seconds += time.perf_counter() - start
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg failed with exit code {returncode}: {self._stderr()}")
+        return self.path
+
+    def abort(self):
+        self._proc.kill()
+        self._proc.wait()
+
+    def _stderr(self):
+        return self._proc.stderr.read().decode("utf-8", errors="replace").strip() if self._proc.stderr else ""
+
+
+class OpenCVVideoWriter:
+    """Fallback: mp4v through cv2.VideoWriter, re-encoded to H.264 by ffmpeg
+    afterwards when ffmpeg is installed (the original two-pass path)."""
+
+    backend = "opencv"
+
+    def __init__(self, path, fps, frame_size):
+        self.path = path
+        self.encode_seconds = 0.0
+        self._out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, frame_size)
+
+    def write(self, frame):
+        start = time.perf_counter()
+        self._out.write(frame)
+        self.encode_seconds += time.perf_counter() - start
+
+    def close(self):
+        self._out.release()
+        if FFMPEG_BIN is None: return self.path
+
+        temp_video_path = self.path.replace(".mp4", "_temp_final.mp4")
+        os.rename(self.path, temp_video_path)
+        logger.info("Running ffmpeg to optimize video for web streaming...")
+        start = time.perf_counter()
+        try:
+            ffmpeg_command = [FFMPEG_BIN, "-y", "-i", temp_video_path, "-c:v", "libx264", "-preset", FFMPEG_PRESET, "-pix_fmt", "yuv420p", "-movflags", "+faststart", self.path]
+            subprocess.run(ffmpeg_command, check=True, capture_output=True, text=True)
+            os.remove(temp_video_path)
+        except Exception as e:
+            logger.error(f"FFmpeg failed: {e}")
+            os.rename(temp_video_path, self.path)
+        reencode_seconds = time.perf_counter() - start
+        self.encode_seconds += reencode_seconds
+        logger.info(f"Second-pass ffmpeg re-encode took {reencode_seconds:.2f}s")
+        return self.path
+
+    def abort(self):
+        self._out.release()
+
+
+def open_video_writer(path, fps, frame_size, backend=None):
+    backend = backend or VIDEO_ENCODER
+    if backend == "auto":
+        backend = "ffmpeg-pipe" if FFMPEG_BIN else "opencv"
+    if backend == "ffmpeg-pipe":
+        if FFMPEG_BIN is None: raise RuntimeError("ffmpeg-pipe encoder requested but ffmpeg is not installed.")
+        return FFmpegPipeWriter(path, fps, frame_size)
+    if FFMPEG_BIN is None: logger.warning("ffmpeg not found; output will be mp4v and may not play in browsers.")
+    return OpenCVVideoWriter(path, fps, frame_size)
+
+
+def concat_videos(part_paths, out_path, fps, frame_size):
+    """Joins segment outputs in order. Uses a stream copy through ffmpeg's concat demuxer
+    when possible, otherwise decodes the parts and re-encodes them. Returns the method used."""
+    if FFMPEG_BIN:
+        list_path = f"{os.path.splitext(out_path)[0]}_parts.txt"
+        with open(list_path, "w") as f:
+            f.writelines(f"file '{os.path.abspath(path)}'\n" for path in part_paths)
+        try:
+            command = [FFMPEG_BIN, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+                       "-c", "copy", "-movflags", "+faststart", out_path]
+            subprocess.run(command, check=True, capture_output=True, text=True)
+            return "concat-copy"
+        except subprocess.CalledProcessError as e:
+            logger.error(f"ffmpeg concat failed, re-encoding the parts instead: {e.stderr.strip()}")
+        finally:
+            os.remove(list_path)
+
+    out = None
+    try:
+        for path in part_paths:
+            cap = cv2.VideoCapture(path)
+            while True:
+                ret, frame = cap.read()
+                if not ret: break
+                # Parts may have been padded to even dimensions; size the writer from the decoded frames.
+                if out is None: out = open_video_writer(out_path, fps, (frame.shape[1], frame.shape[0]))
+                out.write(frame)
+            cap.release()
+    except BaseException:
+        if out: out.abort()
+        raise
+    if out is None: out = open_video_writer(out_path, fps, frame_size)
+    out.close()
+    return "concat-reencode"
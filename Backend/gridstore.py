@@ -0,0 +1,61 @@
+import numpy as np
+
+# --- SETTINGS ---
+GRID_COUNT_DTYPE = np.uint16     # Up to 65535 people per cell per frame
+MAX_GRID_QUERY_FRAMES = 20000    # Rows one /grid_counts request may return
+
+
+class GridCountSeries:
+    """Per-frame grid counts in one preallocated (frames, grid, grid) array instead of a
+    list of nested lists. Grows by doubling when the container's frame count was low."""
+
+    def __init__(self, grid_size, capacity=0):
+        self.data = np.zeros((max(1, capacity), grid_size, grid_size), dtype=GRID_COUNT_DTYPE)
+        self.length = 0
+
+    def append(self, grid_counts):
+        if self.length == len(self.data):
+            self.data = np.concatenate([self.data, np.zeros_like(self.data)])
+        self.data[self.length] = grid_counts
+        self.length += 1
+
+    def array(self):
+        return self.data[:self.length]
+
+
+def save_grid_counts(path, grid_counts):
+    np.save(path, np.ascontiguousarray(grid_counts, dtype=GRID_COUNT_DTYPE))
+    return path
+
+
+def query_grid_counts(path, fps, start=0, end=None, stride=1, per_second=False, cell=None):
+    """Reads a slice of a saved grid count file without loading the rest of it.
+
+    Frames [start, end) are taken every `stride` frames, or averaged per whole second of
+    video when per_second is set. `cell` = (row, col) narrows the result to one cell's
+    series. Returns (frame or second indices, counts). Raises ValueError for bad ranges."""
+    counts = np.load(path, mmap_mode="r")
+    total = len(counts)
+    end = total if end is None else min(end, total)
+    if start < 0 or start > end: raise ValueError(f"Invalid frame range {start}-{end} (video has {total} frames).")
+    if stride < 1: raise ValueError("stride must be at least 1.")
+    if cell is not None:
+        row, col = cell
+        if not (0 <= row < counts.shape[1] and 0 <= col < counts.shape[2]): raise ValueError(f"Cell ({row}, {col}) is outside the grid.")
+        counts = counts[:, row, col]
+
+    if per_second:
+        frames_per_second = max(1, int(fps))
+        first, last = start // frames_per_second, -(-end // frames_per_second)
+        if last - first > MAX_GRID_QUERY_FRAMES: raise ValueError("Range too large; narrow it down.")
+        window = np.asarray(counts[first * frames_per_second:min(last * frames_per_second, total)], dtype=np.float64)
+        # Pad the final partial second so every second can be averaged with one reshape.
+        seconds = -(-len(window) // frames_per_second)
+        padded = np.full((seconds * frames_per_second,) + window.shape[1:], np.nan, dtype=np.float64)
+        padded[:len(window)] = window
+        means = np.nanmean(padded.reshape((seconds, frames_per_second) + window.shape[1:]), axis=1)
+        return list(range(first, first + seconds)), np.round(means, 2).tolist()
+
+    indices = range(start, end, stride)
+    if len(indices) > MAX_GRID_QUERY_FRAMES: raise ValueError(f"Range too large; use a stride of at least {-(-(end - start) // MAX_GRID_QUERY_FRAMES)}.")
+    return list(indices), np.asarray(counts[start:end:stride]).tolist()
@@ -0,0 +1,109 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from metrics import Histogram, LATENCY_BUCKETS_MS
+
+logger = logging.getLogger(__name__)
+
+# --- SETTINGS ---
+INFERENCE_MAX_BATCH = 16        # Frames from all live streams run through YOLO in one call
+INFERENCE_MAX_WAIT_MS = 15      # How long the first queued frame waits for others to join its batch
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class InferenceServer:
+    """Collects frames from every live stream and runs them through the detector as
+    micro-batches on a single worker thread. Callers get a Future per frame."""
+
+    def __init__(self, detect_fn, max_batch=INFERENCE_MAX_BATCH, max_wait_ms=INFERENCE_MAX_WAIT_MS):
+        self.detect_fn = detect_fn  # list of frames -> list of per-frame detections
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._running = False
+        self.queue_latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.inference_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="inference-server", daemon=True)
+        self._thread.start()
+        logger.info(f"Inference server started (max batch {self.max_batch}, max wait {self.max_wait * 1000:.0f}ms)")
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, frame) -> Future:
+        future = Future()
+        if not self._running:
+            future.set_exception(RuntimeError("Inference server is not running."))
+            return future
+        self._queue.put((frame, future, time.perf_counter()))
+        return future
+
+    def detect(self, frame):
+        # Blocking helper for code running on a worker thread (e.g. LiveStreamProcessor).
+        return self.submit(frame).result()
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        if first is None: return None
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0: break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # Re-queue the stop signal for the main loop
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._collect_batch()
+            if batch is None: break
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_latency_ms.observe((started - enqueued) * 1000)
+            self.batch_size.observe(len(batch))
+            try:
+                results = self.detect_fn([frame for frame, _, _ in batch])
+                for (_, future, _), detections in zip(batch, results):
+                    future.set_result(detections)
+            except Exception as e:
+                logger.error(f"Batched inference failed: {e}", exc_info=True)
+                for _, future, _ in batch:
+                    if not future.done(): future.set_exception(e)
+            self.inference_ms.observe((time.perf_counter() - started) * 1000)
+
+        # Fail anything still queued so callers don't hang on shutdown.
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None: item[1].set_exception(RuntimeError("Inference server stopped."))
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(), "max_batch": self.max_batch, "max_wait_ms": self.max_wait * 1000,
+            "queue_latency_ms": self.queue_latency_ms.snapshot(),
+            "inference_ms": self.inference_ms.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+        }
+
+    def collect_metrics(self, out):
+        out.gauge("inference_queue_depth", "Live frames waiting for the shared detector.", self._queue.qsize())
+        out.histogram("inference_queue_latency_ms", "Time a live frame waited before its batch ran.", self.queue_latency_ms)
+        out.histogram("inference_batch_ms", "YOLO inference time per cross-stream batch.", self.inference_ms)
+        out.histogram("inference_batch_size", "Frames per cross-stream inference batch.", self.batch_size)
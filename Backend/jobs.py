@@ -0,0 +1,242 @@
+import os
+import uuid
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from metrics import Histogram, StageTimer
+
+logger = logging.getLogger(__name__)
+
+# --- SETTINGS ---
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", 2))    # Worker processes running process_video
+MAX_QUEUED_JOBS = int(os.environ.get("MAX_QUEUED_JOBS", 16))     # Jobs allowed to wait for a free worker
+JOB_RETENTION_SECONDS = 3600                                     # Finished jobs are forgotten after this
+JOB_FPS_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 100)
+
+QUEUED, RUNNING, COMPLETED, FAILED = "queued", "running", "completed", "failed"
+WORKER_LOST_ERROR = "The analysis worker stopped unexpectedly (it may have run out of memory); please try again."
+
+
+class QueueFullError(Exception):
+    pass
+
+
+# --- WORKER SIDE (runs inside the pool processes) ---
+def _init_worker():
+    # Load and warm up the model as soon as the worker starts, so no job pays for it.
+    # A failure is only recorded here; the jobs then fail with the reason.
+    from analysis import model_manager
+    model_manager.load()
+
+
+def _run_analysis(job_id: str, video_path: str, progress):
+    # Each worker process keeps its own model (see _init_worker) for all the jobs it runs.
+    from analysis import process_video
+
+    def report(frame_idx, total_frames):
+        progress[job_id] = (frame_idx, total_frames)
+
+    report(0, 0)
+    return process_video(video_path, progress_callback=report)
+
+
+# --- API SIDE ---
+class JobManager:
+    """Runs process_video jobs on a bounded process pool and tracks their status."""
+
+    def __init__(self, max_workers=ANALYSIS_WORKERS, max_queued=MAX_QUEUED_JOBS):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._sync_manager = None
+        self._progress = None
+        # Totals over every job this process has run, for /metrics (jobs themselves are purged).
+        self.completed_total = 0
+        self.failed_total = 0
+        self.stage_timings = StageTimer()
+        self.processing_fps = Histogram(JOB_FPS_BUCKETS)
+
+    def start(self):
+        self._start_pool()
+        logger.info(f"Job manager started with {self.max_workers} workers, queue depth {self.max_queued}")
+
+    def _start_pool(self):
+        # 'spawn' keeps torch/CUDA state of the API process out of the workers.
+        ctx = multiprocessing.get_context("spawn")
+        self._sync_manager = ctx.Manager()
+        self._progress = self._sync_manager.dict()
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx, initializer=_init_worker)
+        # Start the workers now rather than on the first upload, so their models load in the background.
+        for _ in range(self.max_workers):
+            self._executor.submit(int)
+
+    def _replace_pool(self, broken):
+        # A worker that dies (OOM-killed, crashed in native code) breaks a ProcessPoolExecutor for
+        # good, so the pool and its progress dict are rebuilt once, by whoever notices first.
+        with self._lock:
+            if self._executor is not broken: return
+            old_manager = self._sync_manager
+            self._start_pool()
+        logger.warning("An analysis worker died; the worker pool has been restarted.")
+        broken.shutdown(wait=False)
+        try:
+            old_manager.shutdown()
+        except Exception:
+            pass
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._sync_manager:
+            self._sync_manager.shutdown()
+            self._sync_manager = None
+
+    def submit(self, video_path: str, filename: str = None, on_result=None, on_failure=None) -> str:
+        # on_result(result), or on_failure(error) if the job fails, is called from a pool callback thread.
+        if self._executor is None:
+            raise RuntimeError("Job manager is not started.")
+        executor = self._executor
+        try:
+            return self._submit(executor, video_path, filename, on_result, on_failure)
+        except BrokenProcessPool:
+            self._replace_pool(executor)
+            return self._submit(self._executor, video_path, filename, on_result, on_failure)
+
+    def _submit(self, executor, video_path, filename, on_result, on_failure):
+        started = self._started()
+        with self._lock:
+            self._purge_finished()
+            queued = sum(1 for job_id in self.jobs if self._status(job_id, started) == QUEUED)
+            if queued >= self.max_queued:
+                raise QueueFullError(f"Analysis queue is full ({queued} jobs waiting).")
+
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = {
+                "job_id": job_id, "filename": filename, "video_path": video_path,
+                "created_at": time.time(), "finished_at": None,
+                "future": None, "result": None, "error": None, "last_progress": (0, 0),
+                "on_result": on_result, "on_failure": on_failure,
+            }
+            try:
+                future = executor.submit(_run_analysis, job_id, video_path, self._progress)
+            except BrokenProcessPool:
+                del self.jobs[job_id]
+                raise
+            self.jobs[job_id]["future"] = future
+        future.add_done_callback(lambda f, job_id=job_id: self._on_done(job_id, f, executor))
+        logger.info(f"Job {job_id} queued for '{filename}'")
+        return job_id
+
+    def _on_done(self, job_id, future, executor):
+        worker_lost = not future.cancelled() and isinstance(future.exception(), BrokenProcessPool)
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None: return
+            job["finished_at"] = time.time()
+            if future.cancelled():
+                job["error"] = "Job was cancelled."
+                self.failed_total += 1
+            elif worker_lost:
+                job["error"] = WORKER_LOST_ERROR
+                self.failed_total += 1
+                logger.error(f"Job {job_id} failed: its worker process died.")
+            elif future.exception() is not None:
+                job["error"] = str(future.exception())
+                self.failed_total += 1
+                logger.error(f"Job {job_id} failed: {job['error']}")
+            else:
+                job["result"] = future.result()
+                self.completed_total += 1
+                performance = job["result"].get("performance", {})
+                self.stage_timings.merge(performance.get("stage_ms", {}))
+                self.processing_fps.observe(performance.get("processing_fps", 0.0))
+                logger.info(f"Job {job_id} completed.")
+            try:
+                job["last_progress"] = self._progress.pop(job_id, job["last_progress"])
+            except (OSError, EOFError):
+                pass  # the Manager process went down with the pool
+        if worker_lost: self._replace_pool(executor)
+        if os.path.exists(job["video_path"]):
+            os.remove(job["video_path"])
+        callback, argument = (job["on_result"], job["result"]) if job["error"] is None else (job["on_failure"], job["error"])
+        if callback:
+            try:
+                callback(argument)
+            except Exception as e:
+                logger.error(f"Completion callback for job {job_id} failed: {e}", exc_info=True)
+
+    def add_completed(self, result, filename: str = None) -> str:
+        """Registers an already finished job (e.g. a cached result) so clients can use the usual job endpoints."""
+        with self._lock:
+            self._purge_finished()
+            job_id = uuid.uuid4().hex
+            now, frames = time.time(), result.get("performance", {}).get("frames_processed", 0)
+            self.jobs[job_id] = {
+                "job_id": job_id, "filename": filename, "video_path": None,
+                "created_at": now, "finished_at": now,
+                "future": None, "result": result, "error": None, "last_progress": (frames, frames),
+                "on_result": None, "on_failure": None,
+            }
+        logger.info(f"Job {job_id} completed from cache for '{filename}'")
+        return job_id
+
+    def _status(self, job_id, started):
+        # started: ids of jobs that reported progress (a _started() snapshot, or the proxy itself for one job).
+        job = self.jobs[job_id]
+        if job["finished_at"] is not None:
+            return FAILED if job["error"] is not None else COMPLETED
+        return RUNNING if job_id in started else QUEUED
+
+    def _started(self):
+        # Every lookup in the Manager dict is an IPC round trip, so status counts take one snapshot.
+        return set(self._progress.keys()) if self._progress is not None else set()
+
+    def _purge_finished(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [j for j, job in self.jobs.items() if job["finished_at"] and job["finished_at"] < cutoff]:
+            del self.jobs[job_id]
+
+    def get_status(self, job_id: str):
+        with self._lock:
+            if job_id not in self.jobs: return None
+            job, status = self.jobs[job_id], self._status(job_id, self._progress)
+            frame_idx, total_frames = self._progress.get(job_id, job["last_progress"])
+            if status == COMPLETED:
+                percent = 100.0
+            else:
+                percent = round(100.0 * frame_idx / total_frames, 1) if total_frames else 0.0
+            return {
+                "job_id": job_id, "filename": job["filename"], "status": status,
+                "progress": percent, "frames_processed": frame_idx, "total_frames": total_frames,
+                "created_at": job["created_at"], "finished_at": job["finished_at"], "error": job["error"],
+            }
+
+    def get_result(self, job_id: str):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else job["result"]
+
+    def stats(self):
+        started = self._started()
+        with self._lock:
+            statuses = [self._status(job_id, started) for job_id in self.jobs]
+        return {
+            "workers": self.max_workers, "max_queued": self.max_queued,
+            **{s: statuses.count(s) for s in (QUEUED, RUNNING, COMPLETED, FAILED)},
+        }
+
+    def collect_metrics(self, out):
+        stats = self.stats()
+        out.gauge("jobs_queued", "Analysis jobs waiting for a worker.", stats[QUEUED])
+        out.gauge("jobs_running", "Analysis jobs being processed.", stats[RUNNING])
+        out.gauge("job_workers", "Worker processes for analysis jobs.", self.max_workers)
+        out.counter("jobs_completed_total", "Analysis jobs that finished successfully.", self.completed_total)
+        out.counter("jobs_failed_total", "Analysis jobs that failed or were cancelled.", self.failed_total)
+        out.histogram("job_processing_fps", "Frames per second of each finished analysis job.", self.processing_fps)
+        out.stages("job_stage_ms", "Per-frame latency of each batch analysis stage, over all finished jobs.", self.stage_timings)
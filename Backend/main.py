@@ -1,12 +1,20 @@
 import os
-import shutil
-from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
+from typing import Optional
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from analysis import process_video, LiveStreamProcessor # MODIFIED: Import the new class
+from fastapi.responses import PlainTextResponse, JSONResponse
+from analysis import LiveStreamProcessor, detect_people, analysis_settings, model_manager, MODEL_PATH # MODIFIED: Import the new class
+from inference import InferenceServer
+from transport import parse_view_options
+from streams import StreamRegistry, StreamLimitError
+from jobs import JobManager, QueueFullError, QUEUED, RUNNING, COMPLETED, FAILED
+from cache import ResultCache
+from gridstore import query_grid_counts
+from uploads import receive_upload, UploadError, UploadTooLargeError, UPLOAD_DIR
+from metrics import MetricsRegistry
 import logging
-import cv2 # MODIFIED: Import cv2
-import base64 # MODIFIED: Import base64
 import asyncio # MODIFIED: Import asyncio
 
 # Setup logging
@@ -14,10 +22,51 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Create directories if they don't exist
-os.makedirs("uploads", exist_ok=True)
+os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs("outputs", exist_ok=True)
 
-app = FastAPI(title="CrowdSentry Analysis API")
+# --- Background analysis jobs (process_video runs in worker processes) ---
+job_manager = JobManager()
+
+# --- Results of earlier analyses, keyed by upload content + model + settings ---
+result_cache = ResultCache(analysis_settings(), MODEL_PATH)
+inflight_jobs = {} # cache key -> job_id, so re-uploads of a clip still being analyzed join that job
+
+# --- Shared YOLO inference for all live streams (cross-stream micro-batching) ---
+inference_server = InferenceServer(lambda frames: detect_people(frames, half=True))
+
+# --- One capture + LiveStreamProcessor per camera, shared by all of its viewers ---
+stream_registry = StreamRegistry(lambda timings: LiveStreamProcessor(detector=inference_server.detect, timings=timings))
+
+# --- Prometheus metrics, gathered from each component when /metrics is scraped ---
+metrics = MetricsRegistry()
+for component in (model_manager, job_manager, result_cache, inference_server, stream_registry):
+    metrics.register(component.collect_metrics)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if model_manager.format != "torch" and model_manager.weights_available:
+        # Export once, before the workers start, so every process loads the same exported model.
+        try:
+            await asyncio.to_thread(model_manager.prepare)
+        except Exception as e:
+            logger.error(f"Model export failed: {e}")
+    job_manager.start()
+    # The server answers right away; /ready reports when the model is loaded and warmed up.
+    model_manager.start_background()
+    inference_server.start()
+    if model_manager.weights_available:
+        await asyncio.to_thread(lambda: result_cache.fingerprint) # Hash the model file once, off the event loop
+    else:
+        logger.warning(f"No YOLO model at {MODEL_PATH}; analysis is unavailable until one is installed.")
+    yield
+    stream_registry.shutdown()
+    inference_server.stop()
+    job_manager.shutdown()
+
+app = FastAPI(title="CrowdSentry Analysis API", lifespan=lifespan)
+
+BASE_URL = "http://127.0.0.1:8000/"
 
 # --- CORS Middleware ---
 app.add_middleware(
@@ -35,36 +84,139 @@ app.mount("/outputs", StaticFiles(directory="outputs"), name="outputs")
 def read_root():
     return {"message": "CrowdSentry Analysis API is running."}
 
-@app.post("/analyze/")
-async def analyze_crowd_video(file: UploadFile = File(...)):
+def model_available():
+    # Weights installed after a failed load are picked up here, without a restart.
+    model_manager.start_background()
+    return model_manager.available
+
+@app.get("/ready")
+def readiness():
     """
-    Endpoint to upload a video, process it, and return analysis results.
+    Readiness probe: 200 once the detection model is loaded and warmed up, 503 while it is
+    still loading or if it could not be loaded.
     """
-    upload_path = os.path.join("uploads", file.filename)
+    model_available()
+    status = model_manager.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+@app.post("/analyze/", status_code=202)
+async def analyze_crowd_video(request: Request):
+    """
+    Endpoint to upload a video (multipart form field "file") and queue it for analysis.
+    Returns a job ID; poll /jobs/{job_id} for progress and fetch /jobs/{job_id}/result when done.
+    """
+    if not model_available():
+        raise HTTPException(status_code=503, detail="No usable detection model is installed on the server.")
+    upload = None
     try:
-        with open(upload_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        logger.info(f"File '{file.filename}' uploaded. Starting analysis...")
-        
-        analysis_results = process_video(upload_path)
-        
-        logger.info("Analysis complete. Sending results.")
-        
-        base_url = "http://127.0.0.1:8000/"
-        analysis_results["processed_video_url"] = f"{base_url}{analysis_results['processed_video_url']}"
-        analysis_results["heatmap_image_url"] = f"{base_url}{analysis_results['heatmap_image_url']}"
-        
-        return analysis_results
-    except FileNotFoundError as e:
-        logger.error(f"File not found during processing: {e}")
-        raise HTTPException(status_code=404, detail=str(e))
+        # Streamed from the request body to a unique file under uploads/, hashed on the way
+        upload = await receive_upload(request)
+        cache_key = result_cache.key(upload.sha256)
+
+        cached_result = await asyncio.to_thread(result_cache.get, cache_key)
+        if cached_result is not None:
+            os.remove(upload.path)
+            job_id = job_manager.add_completed(cached_result, filename=upload.filename)
+            logger.info(f"File '{upload.filename}' matches a cached analysis. Served as job {job_id}.")
+            return {"job_id": job_id, "status": COMPLETED, "cached": True, "status_url": f"/jobs/{job_id}", "result_url": f"/jobs/{job_id}/result"}
+
+        job_id = inflight_jobs.get(cache_key)
+        if job_id is not None and (job_manager.get_status(job_id) or {}).get("status") in (QUEUED, RUNNING):
+            os.remove(upload.path)
+            logger.info(f"File '{upload.filename}' is already being analyzed as job {job_id}.")
+        else:
+            def store_result(result, cache_key=cache_key):
+                result_cache.put(cache_key, result)
+                inflight_jobs.pop(cache_key, None)
+
+            def forget_job(error, cache_key=cache_key):
+                inflight_jobs.pop(cache_key, None)
+
+            job_id = job_manager.submit(upload.path, filename=upload.filename, on_result=store_result, on_failure=forget_job)
+            inflight_jobs[cache_key] = job_id
+            logger.info(f"File '{upload.filename}' uploaded. Analysis queued as job {job_id}.")
+        return {"job_id": job_id, "status": QUEUED, "cached": False, "status_url": f"/jobs/{job_id}", "result_url": f"/jobs/{job_id}/result"}
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFullError as e:
+        logger.warning(str(e))
+        if upload and os.path.exists(upload.path): os.remove(upload.path)
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"An unexpected error occurred: {e}", exc_info=True)
+        if upload and os.path.exists(upload.path): os.remove(upload.path)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
-    finally:
-        if os.path.exists(upload_path):
-            os.remove(upload_path)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Runs on the event loop, so live streams and their viewers can't change while collectors read them.
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/inference/stats")
+def get_inference_stats():
+    return inference_server.stats()
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return result_cache.stats()
+
+@app.get("/streams")
+async def list_streams():
+    return {"streams": stream_registry.stats()}
+
+@app.get("/jobs")
+def list_jobs():
+    return job_manager.stats()
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str):
+    status = job_manager.get_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return status
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    status = job_manager.get_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    if status["status"] == FAILED:
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {status['error']}")
+    if status["status"] != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job is {status['status']} ({status['progress']}%).")
+
+    analysis_results = dict(job_manager.get_result(job_id))
+    analysis_results["processed_video_url"] = f"{BASE_URL}{analysis_results['processed_video_url']}"
+    analysis_results["heatmap_image_url"] = f"{BASE_URL}{analysis_results['heatmap_image_url']}"
+    analysis_results["grid_counts_url"] = f"{BASE_URL}{analysis_results['grid_counts_url']}"
+    return analysis_results
+
+@app.get("/jobs/{job_id}/grid_counts")
+def get_job_grid_counts(job_id: str, start: int = 0, end: Optional[int] = None, stride: int = 1, per_second: bool = False,
+                        row: Optional[int] = None, col: Optional[int] = None):
+    """
+    Per-frame grid counts of a finished job: frames [start, end) every `stride` frames, or
+    per-second averages. Pass row and col to get a single cell's series.
+    """
+    result = job_manager.get_result(job_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No finished analysis for job: {job_id}")
+    cell = (row, col) if row is not None and col is not None else None
+    try:
+        indices, counts = query_grid_counts(result["grid_counts_url"], result["video_fps"], start, end, stride, per_second, cell)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError:
+        # The .npy went with a cache eviction or was removed from outputs/.
+        raise HTTPException(status_code=410, detail=f"Grid counts of job {job_id} are no longer available.")
+    return {
+        "job_id": job_id, "unit": "second" if per_second else "frame", "indices": indices, "counts": counts,
+        "total_frames": result["grid_counts_frames"], "fps": result["video_fps"], "grid_dimensions": result["grid_dimensions"],
+    }
 
 
 # --- NEW: WEBSOCKET ENDPOINT FOR LIVE ANALYSIS ---
@@ -73,47 +225,45 @@ async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     logger.info("WebSocket connection accepted.")
     
-    cap = None
+    stream = subscription = None
     try:
-        # Wait for the initial message from the client to select the source
+        # Wait for the initial message from the client to select the source:
+        # "webcam", a device number, a camera named in CAPTURE_CAMERAS, or a file under CAPTURE_FILE_ROOT.
+        # Optional "quality" (JPEG) and "max_width" (downscale) tune the frames this client receives.
         message = await websocket.receive_json()
-        source = message.get("source")
-
-        if source == "webcam":
-            # Use the default webcam on the server
-            cap = cv2.VideoCapture(0)
-            if not cap.isOpened():
-                await websocket.send_json({"error": "Could not open webcam."})
-                return
-        else:
-            # Later, you can add logic for CCTV URLs
-            await websocket.send_json({"error": "Invalid source specified."})
+        quality, max_width = parse_view_options(message)
+        if not model_available():
+            await websocket.send_json({"error": "Detection model is unavailable."})
+            return
+        try:
+            # Viewers of the same camera share one capture + analysis pipeline
+            stream, subscription = await stream_registry.subscribe(message.get("source"))
+        except (ValueError, StreamLimitError) as e:
+            await websocket.send_json({"error": str(e)})
+            return
+        except IOError:
+            await websocket.send_json({"error": "Could not open video source."})
             return
 
-        # Each connection gets its own processor instance to maintain state
-        processor = LiveStreamProcessor()
-        
         while True:
-            ret, frame = cap.read()
-            if not ret:
+            # Newest analyzed update; if this client falls behind, older ones are dropped for it alone
+            update = await subscription.get()
+            if update is None:
                 break
 
-            # Analyze the current frame
-            processed_frame, analysis_data = processor.analyze_frame(frame)
-
-            # Encode the processed frame to JPEG and then to Base64
-            _, buffer = cv2.imencode('.jpg', processed_frame)
-            frame_b64 = base64.b64encode(buffer).decode('utf-8')
+            # JSON metadata first, then the JPEG frame (and any heatmaps) as raw binary messages.
+            # Encodes are memoized on the update, so viewers with the same settings share them.
+            with stream.timings.time("encode"):
+                metadata, payloads = await asyncio.to_thread(update.messages, quality, max_width)
+            with stream.timings.time("send"):
+                await websocket.send_text(metadata)
+                for payload in payloads:
+                    await websocket.send_bytes(payload)
 
-            # Send the frame and analysis data to the client
-            await websocket.send_json({
-                "frame": frame_b64,
-                "total_count": analysis_data["total_count"],
-                "alerts": analysis_data["alerts"]
-            })
-            
-            # Allow other tasks to run
-            await asyncio.sleep(0.01)
+        if stream.error:
+            await websocket.send_json({"error": stream.error})
+        # Source ended (e.g. a sample file ran out): tell the client instead of leaving the socket idle
+        await websocket.close()
 
     except WebSocketDisconnect:
         logger.info("WebSocket connection closed by client.")
@@ -121,6 +271,6 @@ async def websocket_endpoint(websocket: WebSocket):
         logger.error(f"Error in WebSocket: {e}", exc_info=True)
         await websocket.send_json({"error": "An internal error occurred."})
     finally:
-        if cap:
-            cap.release()
+        if subscription:
+            stream_registry.unsubscribe(stream, subscription)
         logger.info("WebSocket resources cleaned up.")
@@ -0,0 +1,165 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# --- SETTINGS ---
+METRICS_PREFIX = "crowdsentry"
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+STAGE_BUCKETS_MS = (0.25, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+class Histogram:
+    """Cumulative bucket counts plus sum/count, in the style of a Prometheus histogram."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value, n=1):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += n
+            self.total += value * n
+            self.count += n
+
+    def merge(self, snapshot):
+        # Adds a snapshot() taken elsewhere (e.g. in a worker process) with the same buckets.
+        cumulative = list(snapshot["buckets"].values())
+        with self._lock:
+            for i, (n, previous) in enumerate(zip(cumulative, [0] + cumulative[:-1])):
+                self.counts[i] += n - previous
+            self.total += snapshot["sum"]
+            self.count += snapshot["count"]
+
+    def snapshot(self):
+        with self._lock:
+            cumulative, running = {}, 0
+            for bound, n in zip(self.buckets + ("+Inf",), self.counts):
+                running += n
+                cumulative[str(bound)] = running
+            return {"buckets": cumulative, "sum": round(self.total, 3), "count": self.count,
+                    "mean": round(self.total / self.count, 3) if self.count else 0.0}
+
+
+def histogram_quantile(snapshot, q):
+    """Estimates the q-quantile (0-1) of a Histogram snapshot by interpolating inside
+    the bucket it falls in, like PromQL's histogram_quantile."""
+    count = snapshot["count"]
+    if not count: return 0.0
+    rank, lower, previous = q * count, 0.0, 0
+    for bound, cumulative in snapshot["buckets"].items():
+        if cumulative >= rank:
+            if bound == "+Inf": return lower
+            upper = float(bound)
+            return lower + (upper - lower) * (rank - previous) / max(1, cumulative - previous)
+        lower, previous = float(bound), cumulative
+    return lower
+
+
+class StageTimer:
+    """Latency histograms (ms) per named pipeline stage for one job or live stream.
+    Costs two perf_counter calls and a lock per timed call, so it is always on."""
+
+    def __init__(self, buckets=STAGE_BUCKETS_MS):
+        self.buckets = buckets
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.stages.setdefault(stage, Histogram(self.buckets))
+        return histogram
+
+    def observe(self, stage, elapsed_ms):
+        self.histogram(stage).observe(elapsed_ms)
+
+    def observe_batch(self, stage, elapsed_ms, frames):
+        # Spreads a batched call evenly over its frames, so every stage reads in ms per frame.
+        if frames: self.histogram(stage).observe(elapsed_ms / frames, frames)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(stage).observe((time.perf_counter() - start) * 1000)
+
+    def merge(self, snapshot):
+        for stage, histogram in snapshot.items():
+            self.histogram(stage).merge(histogram)
+
+    def snapshot(self):
+        return {stage: histogram.snapshot() for stage, histogram in list(self.stages.items())}
+
+
+class MetricsWriter:
+    """Builds one Prometheus text exposition. Samples are grouped by metric name, so
+    collectors can add the same metric with different labels in any order."""
+
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self._families = {}  # name -> (type, help, lines)
+
+    def _family(self, name, kind, help_text):
+        name = f"{self.prefix}_{name}"
+        if name not in self._families: self._families[name] = (kind, help_text, [])
+        return name, self._families[name][2]
+
+    @staticmethod
+    def _labels(labels):
+        if not labels: return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+        return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+    def counter(self, name, help_text, value, **labels):
+        name, lines = self._family(name, "counter", help_text)
+        lines.append(f"{name}{self._labels(labels)} {value}")
+
+    def gauge(self, name, help_text, value, **labels):
+        name, lines = self._family(name, "gauge", help_text)
+        lines.append(f"{name}{self._labels(labels)} {value}")
+
+    def histogram(self, name, help_text, histogram, **labels):
+        name, lines = self._family(name, "histogram", help_text)
+        snapshot = histogram.snapshot() if isinstance(histogram, Histogram) else histogram
+        for bound, count in snapshot["buckets"].items():
+            lines.append(f"{name}_bucket{self._labels({**labels, 'le': bound})} {count}")
+        lines.append(f"{name}_sum{self._labels(labels)} {snapshot['sum']}")
+        lines.append(f"{name}_count{self._labels(labels)} {snapshot['count']}")
+
+    def stages(self, name, help_text, timer, **labels):
+        for stage, histogram in timer.snapshot().items():
+            self.histogram(name, help_text, histogram, **labels, stage=stage)
+
+    def render(self):
+        out = []
+        for name, (kind, help_text, lines) in self._families.items():
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+
+class MetricsRegistry:
+    """Collectors are called only when /metrics is scraped; each gets a MetricsWriter and
+    reports from the state its component already keeps, so nothing is exported on the hot path."""
+
+    def __init__(self):
+        self._collectors = []
+
+    def register(self, collector):
+        self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        writer = MetricsWriter()
+        for collector in self._collectors:
+            collector(writer)
+        return writer.render()
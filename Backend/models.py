@@ -0,0 +1,164 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# --- SETTINGS ---
+MODEL_CANDIDATES = ("best_final.pt", "best.pt")              # First one that exists is used
+MODEL_FORMAT = os.environ.get("MODEL_FORMAT", "torch")        # "torch", or an export format for faster CPU inference: "onnx", "openvino"
+MODEL_FORMATS = ("torch", "onnx", "openvino")
+MODEL_WARMUP_SIZE = 640                                       # Side of the blank frame used for warmup inference
+MODEL_WARMUP_RUNS = 2
+
+NOT_LOADED, LOADING, READY, FAILED = "not_loaded", "loading", "ready", "failed"
+
+
+class ModelUnavailableError(RuntimeError):
+    pass
+
+
+def resolve_model_path(candidates=MODEL_CANDIDATES):
+    for path in candidates:
+        if os.path.exists(path): return path
+    return candidates[-1]
+
+
+def exported_model_path(weights_path, fmt):
+    # Where ultralytics' export() puts each format, next to the weights.
+    root = os.path.splitext(weights_path)[0]
+    return {"onnx": f"{root}.onnx", "openvino": f"{root}_openvino_model"}[fmt]
+
+
+class ModelManager:
+    """Owns the process's YOLO model. Nothing is loaded at import: the model is loaded by
+    the first get(), or ahead of time by load() / start_background(), and warmed up with a
+    blank frame so the first real request doesn't pay for lazy torch/CUDA initialization.
+
+    With an export format, prepare() exports the weights once and every process (API and
+    workers) loads the exported file; the export is reused until the weights change.
+
+    A failed load is retried once the weights file appears or is replaced, so installing
+    weights on a running server doesn't need a restart."""
+
+    def __init__(self, weights_path=None, fmt=MODEL_FORMAT, loader=None):
+        if fmt not in MODEL_FORMATS: raise ValueError(f"Unknown MODEL_FORMAT '{fmt}'; choose from {', '.join(MODEL_FORMATS)}")
+        self.weights_path = weights_path or resolve_model_path()
+        self.format = fmt
+        self.model_path = None  # file actually loaded (weights or export)
+        self.state = NOT_LOADED
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.person_class_ids = None
+        self._failed_mtime = None  # weights mtime (None: missing) when the last load failed
+        self._loader = loader  # path -> model; defaults to ultralytics.YOLO
+        self._model = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def weights_available(self):
+        return self._model is not None or os.path.exists(self.weights_path)
+
+    @property
+    def can_retry(self):
+        return self.state == FAILED and self._weights_mtime() != self._failed_mtime
+
+    @property
+    def available(self):
+        # False only while there are no weights, or the installed ones already failed to load.
+        if self.state == FAILED: return self.can_retry
+        return self.weights_available
+
+    def _weights_mtime(self):
+        try:
+            return os.path.getmtime(self.weights_path)
+        except OSError:
+            return None
+
+    def prepare(self):
+        """Returns the path to load, exporting the weights first if a non-torch format is
+        configured and there is no up-to-date export yet. Raises FileNotFoundError without weights."""
+        if not os.path.exists(self.weights_path): raise FileNotFoundError(f"YOLO model not found ({' or '.join(MODEL_CANDIDATES)}).")
+        if self.format == "torch": return self.weights_path
+
+        export_path = exported_model_path(self.weights_path, self.format)
+        if not os.path.exists(export_path) or os.path.getmtime(export_path) < os.path.getmtime(self.weights_path):
+            from ultralytics import YOLO
+            logger.info(f"Exporting {self.weights_path} to {self.format}...")
+            start = time.perf_counter()
+            export_path = YOLO(self.weights_path).export(format=self.format)
+            logger.info(f"Exported {export_path} in {time.perf_counter() - start:.1f}s")
+        return export_path
+
+    def _load_model(self, path):
+        if self._loader: return self._loader(path)
+        from ultralytics import YOLO
+        # Exports don't always record their task; the .pt weights do.
+        return YOLO(path) if self.format == "torch" else YOLO(path, task="detect")
+
+    def load(self):
+        """Loads and warms up the model if that hasn't happened yet. Never raises: a failure is
+        recorded in state/error and reported by get() and status()."""
+        with self._lock:
+            if self.state == READY: return True
+            if self.state == FAILED and not self.can_retry: return False
+            self.state = LOADING
+            weights_mtime = self._weights_mtime()
+            try:
+                start = time.perf_counter()
+                self.model_path = self.prepare()
+                logger.info(f"Loading YOLO model from {self.model_path}...")
+                model = self._load_model(self.model_path)
+                self.load_seconds = time.perf_counter() - start
+
+                start = time.perf_counter()
+                blank = np.zeros((MODEL_WARMUP_SIZE, MODEL_WARMUP_SIZE, 3), dtype=np.uint8)
+                for _ in range(MODEL_WARMUP_RUNS):
+                    model([blank], verbose=False)
+                self.warmup_seconds = time.perf_counter() - start
+                self._install(model)
+                logger.info(f"Model ready: loaded in {self.load_seconds:.1f}s, warmed up in {self.warmup_seconds:.1f}s")
+            except Exception as e:
+                self.state, self.error, self._failed_mtime = FAILED, str(e), weights_mtime
+                logger.error(f"Could not load the YOLO model: {e}")
+            return self.state == READY
+
+    def start_background(self):
+        # Load on a daemon thread so the server starts answering (and reports not-ready) right away.
+        # Also retries a failed load once new weights are in place.
+        if (self._thread is None or not self._thread.is_alive()) and (self.state == NOT_LOADED or self.can_retry):
+            self._thread = threading.Thread(target=self.load, name="model-loader", daemon=True)
+            self._thread.start()
+
+    def _install(self, model):
+        self.person_class_ids = np.array([cls_id for cls_id, name in model.names.items() if name == "person"])
+        self._model = model
+        self.state, self.error = READY, None
+
+    def set(self, model):
+        # Installs an already loaded detector (anything called like an ultralytics YOLO model, e.g. benchmark.py's stub).
+        with self._lock:
+            self._install(model)
+        return model
+
+    def get(self):
+        if self._model is None and not self.load():
+            raise ModelUnavailableError(f"Detection model is unavailable: {self.error}")
+        return self._model
+
+    def status(self):
+        return {
+            "state": self.state, "ready": self.state == READY, "error": self.error, "format": self.format,
+            "weights_path": self.weights_path, "model_path": self.model_path,
+            "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            "warmup_seconds": round(self.warmup_seconds, 2) if self.warmup_seconds is not None else None,
+        }
+
+    def collect_metrics(self, out):
+        out.gauge("model_ready", "1 once the detection model is loaded and warmed up.", int(self.state == READY))
+        if self.load_seconds is not None: out.gauge("model_load_seconds", "Time taken to load (and export) the model.", round(self.load_seconds, 3))
+        if self.warmup_seconds is not None: out.gauge("model_warmup_seconds", "Time taken by the warmup inferences.", round(self.warmup_seconds, 3))
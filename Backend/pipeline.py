@@ -0,0 +1,75 @@
+import os
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# --- SETTINGS ---
+PIPELINE_QUEUE_SIZE = 2                                      # Items buffered between stages; bounds memory on long/4K videos
+RENDER_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))   # Threads drawing overlays (OpenCV releases the GIL)
+
+
+class PipelineAborted(Exception):
+    pass
+
+
+class StagePipeline:
+    """Threads connected by bounded queues. A failure in any stage aborts every
+    stage, and the original exception is re-raised from join()."""
+
+    _END = object()
+
+    def __init__(self):
+        self._abort = threading.Event()
+        self._error = None
+        self._threads = []
+
+    def queue(self, maxsize=PIPELINE_QUEUE_SIZE):
+        return queue.Queue(maxsize=maxsize)
+
+    def put(self, q, item):
+        # Blocks while the queue is full (backpressure), but wakes up if the pipeline is aborted.
+        while True:
+            if self._abort.is_set(): raise PipelineAborted()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def close(self, q):
+        self.put(q, self._END)
+
+    def items(self, q):
+        while True:
+            if self._abort.is_set(): raise PipelineAborted()
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is self._END: return
+            yield item
+
+    def spawn(self, name, target, *args):
+        def run():
+            try:
+                target(*args)
+            except PipelineAborted:
+                pass
+            except BaseException as e:
+                logger.error(f"Pipeline stage '{name}' failed: {e}")
+                if self._error is None: self._error = e
+                self._abort.set()
+
+        thread = threading.Thread(target=run, name=f"pipeline-{name}", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def abort(self):
+        self._abort.set()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+        if self._error is not None: raise self._error
@@ -0,0 +1,164 @@
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+import cv2
+from density import foot_points
+
+# --- SETTINGS ---
+HEATMAP_RENDER_DOWNSCALE = 8   # Density heatmap is blurred at 1/8 resolution and upscaled once
+GRID_LAYER_CACHE_SIZE = 4      # Recent (frame size, grid, counts) overlays kept for reuse
+SAFE_COLOR, UNSAFE_COLOR = (0, 200, 0), (0, 0, 255)
+
+LIVE_HEATMAP_DOWNSCALE = 8          # Live heatmap accumulates at 1/8 resolution
+LIVE_HEATMAP_HALF_LIFE_SECONDS = 30 # Activity this old counts half as much
+LIVE_HEATMAP_SIGMA = 20             # Blur radius in full-resolution pixels
+
+
+class OverlayRenderer:
+    """Draws the analysis overlay on a frame. Everything that depends only on the frame
+    size, grid size and grid counts (heatmap, grid lines, cell labels) is built once and
+    reused while the counts stay the same. Safe to call from several render threads."""
+
+    def __init__(self, density_threshold):
+        self.density_threshold = density_threshold
+        self._lock = threading.Lock()
+        self._grid_lines = {}            # (w, h, grid_size) -> (layer, mask)
+        self._grid_layers = OrderedDict()  # (w, h, grid_size, counts) -> (heatmap, layer, mask)
+        self.frames_rendered = 0
+        self.cache_hits = 0
+        self.total_render_ms = 0.0
+        self.last_render_ms = 0.0
+
+    @property
+    def avg_render_ms(self):
+        return self.total_render_ms / self.frames_rendered if self.frames_rendered else 0.0
+
+    def heatmap_overlay(self, grid_counts, width, height, grid_size):
+        if np.max(grid_counts) == 0:
+            return np.zeros((height, width, 3), dtype=np.uint8)
+        low_w, low_h = max(grid_size, width // HEATMAP_RENDER_DOWNSCALE), max(grid_size, height // HEATMAP_RENDER_DOWNSCALE)
+        blocky_heatmap = cv2.resize(grid_counts.astype(np.float32), (low_w, low_h), interpolation=cv2.INTER_NEAREST)
+        kernel_size = max(3, int(low_w / grid_size // 2) * 2 + 1)
+        blurred_heatmap = cv2.GaussianBlur(blocky_heatmap, (kernel_size, kernel_size), 0)
+        norm_heatmap = cv2.normalize(blurred_heatmap, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+        return cv2.resize(cv2.applyColorMap(norm_heatmap, cv2.COLORMAP_JET), (width, height), interpolation=cv2.INTER_LINEAR)
+
+    def _lines_layer(self, width, height, grid_size):
+        key = (width, height, grid_size)
+        if key not in self._grid_lines:
+            layer, mask = np.zeros((height, width, 3), dtype=np.uint8), np.zeros((height, width), dtype=np.uint8)
+            cell_w, cell_h = max(1, width // grid_size), max(1, height // grid_size)
+            for gy in range(grid_size):
+                for gx in range(grid_size):
+                    top_left, bottom_right = (gx * cell_w, gy * cell_h), (gx * cell_w + cell_w, gy * cell_h + cell_h)
+                    cv2.rectangle(layer, top_left, bottom_right, SAFE_COLOR, 1)
+                    cv2.rectangle(mask, top_left, bottom_right, 255, 1)
+            self._grid_lines[key] = (layer, mask)
+        return self._grid_lines[key]
+
+    def _build_grid_layer(self, grid_counts, width, height, grid_size):
+        lines_layer, lines_mask = self._lines_layer(width, height, grid_size)
+        layer, mask = lines_layer.copy(), lines_mask.copy()
+        cell_w, cell_h = max(1, width // grid_size), max(1, height // grid_size)
+        for gy in range(grid_size):
+            for gx in range(grid_size):
+                count = int(grid_counts[gy, gx])
+                color = UNSAFE_COLOR if count >= self.density_threshold else SAFE_COLOR
+                if color == UNSAFE_COLOR:
+                    cv2.rectangle(layer, (gx * cell_w, gy * cell_h), (gx * cell_w + cell_w, gy * cell_h + cell_h), color, 1)
+                text_pos = (gx * cell_w + 5, gy * cell_h + 20)
+                cv2.putText(layer, str(count), text_pos, cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,0,0), 4)
+                cv2.putText(layer, str(count), text_pos, cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+                cv2.putText(mask, str(count), text_pos, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 255, 4)
+        return self.heatmap_overlay(grid_counts, width, height, grid_size), layer, mask
+
+    def _get_grid_layer(self, grid_counts, width, height, grid_size):
+        key = (width, height, grid_size, grid_counts.tobytes())
+        with self._lock:
+            cached = self._grid_layers.get(key)
+            if cached is not None:
+                self._grid_layers.move_to_end(key)
+                self.cache_hits += 1
+                return cached
+        # Built outside the lock so render threads only serialize on the cache lookup.
+        cached = self._build_grid_layer(grid_counts, width, height, grid_size)
+        with self._lock:
+            self._grid_layers[key] = cached
+            if len(self._grid_layers) > GRID_LAYER_CACHE_SIZE: self._grid_layers.popitem(last=False)
+        return cached
+
+    def render(self, frame, grid_counts, grid_size, track_overlays, total_count):
+        start = time.perf_counter()
+        frame_h, frame_w = frame.shape[:2]
+        heatmap_overlay, grid_layer, grid_mask = self._get_grid_layer(grid_counts, frame_w, frame_h, grid_size)
+
+        vis = cv2.addWeighted(heatmap_overlay, 0.4, frame, 0.6, 0)
+        cv2.copyTo(grid_layer, grid_mask, vis)
+
+        for (x1, y1, x2, y2), det_conf, arrow in track_overlays:
+            if det_conf is not None:
+                label = f"P: {det_conf:.2f}"
+                cv2.rectangle(vis, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                (w, h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+                cv2.rectangle(vis, (x1, y1 - h - 10), (x1 + w, y1 - 5), (0, 255, 0), cv2.FILLED)
+                cv2.putText(vis, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+            if arrow is not None:
+                start_point, end_point, arrow_color = arrow
+                cv2.arrowedLine(vis, start_point, end_point, arrow_color, 2, tipLength=0.5)
+
+        cv2.putText(vis, f"Total Count: {total_count}", (40, frame_h - 40), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0,0,0), 6)
+        cv2.putText(vis, f"Total Count: {total_count}", (40, frame_h - 40), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255,255,255), 2)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.frames_rendered += 1
+            self.total_render_ms += elapsed_ms
+            self.last_render_ms = elapsed_ms
+        return vis
+
+
+class LiveHeatmap:
+    """Foot-point heatmap of recent activity for a live stream. Hits are accumulated at low
+    resolution with exponential decay over wall-clock time, so the half-life holds whatever
+    rate frames arrive at. The decay is applied lazily: new hits are added with a growing
+    weight and the map is rescaled only before that weight gets large, so each frame costs
+    O(people). Rendering is scale-invariant, so it never needs the decayed values."""
+
+    def __init__(self, half_life_seconds=LIVE_HEATMAP_HALF_LIFE_SECONDS, downscale=LIVE_HEATMAP_DOWNSCALE):
+        self.half_life = half_life_seconds
+        self.downscale = downscale
+        self.acc = None
+        self._weight = 1.0  # weight of a hit added now, relative to the stored values
+        self._last_add = None  # time.monotonic() of the previous add()
+
+    def add(self, boxes, frame_w, frame_h, now=None):
+        now = time.monotonic() if now is None else now
+        low_w, low_h = max(1, frame_w // self.downscale), max(1, frame_h // self.downscale)
+        if self.acc is None or self.acc.shape != (low_h, low_w):
+            self.acc, self._weight = np.zeros((low_h, low_w), dtype=np.float32), 1.0
+        elif self._last_add is not None:
+            # Anything older than 64 half-lives is gone anyway; the cap keeps the power finite.
+            self._weight *= 2.0 ** min((now - self._last_add) / self.half_life, 64.0)
+            if self._weight > 1e6: self._rescale()
+        self._last_add = now
+        cx, cy = foot_points(boxes)
+        inside = (cx >= 0) & (cx < frame_w) & (cy >= 0) & (cy < frame_h)
+        if not inside.any(): return
+        gx, gy = np.minimum(cx[inside] // self.downscale, low_w - 1), np.minimum(cy[inside] // self.downscale, low_h - 1)
+        np.add.at(self.acc, (gy, gx), self._weight)
+
+    def _rescale(self):
+        # Fold the pending decay into the stored values so hit weights stay small.
+        self.acc /= self._weight
+        self._weight = 1.0
+
+    def render(self):
+        """Colour-mapped heatmap at the accumulator's resolution, or None while empty."""
+        if self.acc is None: return None
+        blurred = cv2.GaussianBlur(self.acc, (0, 0), LIVE_HEATMAP_SIGMA / self.downscale)
+        # Normalizing by the max of the 1/64-size map replaces the full-resolution percentile.
+        vmax = float(blurred.max())
+        if vmax <= 0: return None
+        hm_norm = cv2.convertScaleAbs(blurred, alpha=255.0 / vmax)
+        return cv2.applyColorMap(hm_norm, cv2.COLORMAP_JET)
@@ -0,0 +1,68 @@
+import math
+import time
+from collections import deque
+
+# --- SETTINGS ---
+LIVE_TARGET_FPS = 15.0        # Output frame rate the live loop tries to sustain
+LIVE_MAX_FRAME_SKIP = 12      # Never run detection less often than 1 in (this + 1) frames
+COST_SMOOTHING = 0.2          # EMA weight of the newest timing sample
+RISING_DENSITY_MARGIN = 0.1   # Count must exceed its running average by this fraction to count as rising
+URGENT_HOLD_SECONDS = 3.0     # How long a rise in density / new alert keeps the analysis rate boosted
+
+
+class AdaptiveFrameScheduler:
+    """Decides which live frames get the full detection + tracking pass. The skip
+    rate is derived from the measured analysis and render cost so the stream holds
+    LIVE_TARGET_FPS, and is cut for a while after density rises or a cell turns unsafe."""
+
+    def __init__(self, initial_skip, target_fps=LIVE_TARGET_FPS, max_skip=LIVE_MAX_FRAME_SKIP):
+        self.target_fps = target_fps
+        self.max_skip = max_skip
+        self.skip = initial_skip
+        self.analysis_ms = None
+        self.render_ms = None
+        self.count_avg = None
+        self.urgent = False
+        self._urgent_until = 0.0
+        self.frames_since_analysis = initial_skip  # analyze the very first frame
+        self._analyzed_at = deque(maxlen=30)
+
+    def should_analyze(self):
+        return self.frames_since_analysis >= self.skip
+
+    def record_analysis(self, elapsed_ms):
+        self.analysis_ms = elapsed_ms if self.analysis_ms is None else (1 - COST_SMOOTHING) * self.analysis_ms + COST_SMOOTHING * elapsed_ms
+        self.frames_since_analysis = 0
+        self._analyzed_at.append(time.perf_counter())
+
+    def frame_done(self, render_ms, total_count, new_alerts):
+        self.frames_since_analysis += 1
+        self.render_ms = render_ms if self.render_ms is None else (1 - COST_SMOOTHING) * self.render_ms + COST_SMOOTHING * render_ms
+
+        rising = self.count_avg is not None and total_count > self.count_avg * (1 + RISING_DENSITY_MARGIN) + 0.5
+        self.count_avg = total_count if self.count_avg is None else (1 - COST_SMOOTHING) * self.count_avg + COST_SMOOTHING * total_count
+        now = time.perf_counter()
+        if rising or new_alerts: self._urgent_until = now + URGENT_HOLD_SECONDS
+        self.urgent = now < self._urgent_until
+        self.skip = self._choose_skip()
+
+    def _choose_skip(self):
+        if self.analysis_ms is None: return self.skip
+        # Every frame pays render_ms; one frame in (skip + 1) also pays analysis_ms.
+        budget_ms = 1000.0 / self.target_fps - (self.render_ms or 0.0)
+        skip = self.max_skip if budget_ms <= 0 else math.ceil(self.analysis_ms / budget_ms) - 1
+        if self.urgent: skip //= 2
+        return max(0, min(skip, self.max_skip))
+
+    @property
+    def analysis_rate(self):
+        # Detector runs per second over the recent window.
+        if len(self._analyzed_at) < 2: return 0.0
+        span = self._analyzed_at[-1] - self._analyzed_at[0]
+        return (len(self._analyzed_at) - 1) / span if span > 0 else 0.0
+
+    def stats(self):
+        return {
+            "analysis_rate": round(self.analysis_rate, 2), "frame_skip": self.skip, "urgent": self.urgent,
+            "analysis_ms": round(self.analysis_ms or 0.0, 1), "render_ms": round(self.render_ms or 0.0, 1),
+        }
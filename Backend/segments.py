@@ -0,0 +1,78 @@
+import os
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_EXCEPTION
+from encoder import concat_videos
+
+logger = logging.getLogger(__name__)
+
+# --- SETTINGS ---
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", 1))  # Processes per upload; 1 keeps process_video serial
+MIN_CHUNK_SECONDS = 60          # Never split a video into segments shorter than this
+CHUNK_OVERLAP_SECONDS = 2.0     # Video before each segment fed to its tracker only; never less than the tracker's max_age in frames
+PROGRESS_POLL_SECONDS = 1.0
+
+
+def plan_segments(total_frames, fps, workers):
+    """Splits [0, total_frames) into at most `workers` contiguous (start, end) ranges of at
+    least MIN_CHUNK_SECONDS. The last end is None so it reads to the real end of the file."""
+    min_frames = max(1, int(MIN_CHUNK_SECONDS * fps))
+    count = max(1, min(workers, total_frames // min_frames))
+    bounds = [round(i * total_frames / count) for i in range(count + 1)]
+    return [(bounds[i], bounds[i + 1] if i < count - 1 else None) for i in range(count)]
+
+
+# --- WORKER SIDE (runs inside the segment processes) ---
+def _init_worker(threads):
+    # Share the cores between segment workers instead of each torch/OpenCV pool claiming all of them.
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    import cv2
+    cv2.setNumThreads(threads)
+
+
+def _run_segment(index, progress, video_in_path, grid_size, part_path, start_frame, end_frame, warmup_frames, batch_size):
+    # Imported here so each worker process loads its own model.
+    from analysis import analyze_segment
+
+    def report(frames_done, _):
+        progress[index] = frames_done
+
+    return analyze_segment(video_in_path, grid_size, part_path, start_frame, end_frame, warmup_frames, batch_size, report)
+
+
+# --- PARENT SIDE ---
+def run_segments(video_in_path, grid_size, video_out_path, segment_bounds, fps, frame_size, batch_size, tracker_max_age, total_frames, progress_callback=None):
+    """Analyzes each segment in its own process (own model and DeepSort), then joins the
+    rendered parts into video_out_path. Returns (segment results in order, encoder used)."""
+    # Tracks coasting across a boundary survive up to tracker_max_age frames, however low the fps.
+    warmup_frames = max(int(CHUNK_OVERLAP_SECONDS * fps), tracker_max_age)
+    root, ext = os.path.splitext(video_out_path)
+    part_paths = [f"{root}_part{i}{ext}" for i in range(len(segment_bounds))]
+    threads = max(1, (os.cpu_count() or 1) // len(segment_bounds))
+    ctx = multiprocessing.get_context("spawn")
+    start = time.time()
+
+    try:
+        with ctx.Manager() as manager, ProcessPoolExecutor(max_workers=len(segment_bounds), mp_context=ctx,
+                                                           initializer=_init_worker, initargs=(threads,)) as pool:
+            progress = manager.dict()
+            futures = [pool.submit(_run_segment, i, progress, video_in_path, grid_size, part_path, start_frame, end_frame, warmup_frames, batch_size)
+                       for i, (part_path, (start_frame, end_frame)) in enumerate(zip(part_paths, segment_bounds))]
+            while True:
+                done, pending = wait(futures, timeout=PROGRESS_POLL_SECONDS, return_when=FIRST_EXCEPTION)
+                if progress_callback:
+                    frames_done = sum(progress.values())
+                    progress_callback(frames_done, max(total_frames, frames_done))
+                if not pending or any(future.exception() for future in done): break
+            for future in pending: future.cancel()
+            segments = [future.result() for future in futures]  # Re-raises the first failure
+        analysis_seconds = time.time() - start
+
+        encoder_backend = f"{segments[0]['encoder']}+{concat_videos(part_paths, video_out_path, fps, frame_size)}"
+    finally:
+        for part_path in part_paths:
+            if os.path.exists(part_path): os.remove(part_path)
+
+    logger.info(f"Analyzed {len(segment_bounds)} segments in parallel in {analysis_seconds:.1f}s, joined in {time.time() - start - analysis_seconds:.1f}s")
+    return segments, encoder_backend
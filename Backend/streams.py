@@ -0,0 +1,196 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from capture import FrameGrabber, resolve_source, display_name
+from transport import LiveUpdate
+from metrics import StageTimer
+
+logger = logging.getLogger(__name__)
+
+# --- SETTINGS ---
+SUBSCRIBER_QUEUE_SIZE = 2   # Updates buffered per viewer; a slow viewer loses the oldest ones
+FPS_WINDOW_FRAMES = 50      # Recent frames the reported live FPS is measured over
+MAX_LIVE_STREAMS = int(os.environ.get("MAX_LIVE_STREAMS", 4))  # Distinct sources analyzed at once; each costs a capture and an analysis thread
+
+
+class StreamLimitError(Exception):
+    pass
+
+
+class Subscription:
+    """One viewer's bounded queue of LiveUpdates. None marks the end of the stream."""
+
+    def __init__(self, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, update):
+        if self.queue.full():
+            # Drop the oldest update rather than slowing the camera down for everyone.
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(update)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class LiveStream:
+    """A single capture + LiveStreamProcessor for one source. Every analyzed frame is
+    wrapped in one LiveUpdate and offered to all subscribers, so encodes are shared too.
+    processor_factory(timings) gets the stream's StageTimer so all its stages report together.
+
+    analyze_frame blocks on the shared InferenceServer, so each stream analyzes on its own
+    thread rather than the default executor: streams never wait for each other's threads
+    to join a batch, and the default executor stays free for encodes and other to_thread work."""
+
+    def __init__(self, source, processor_factory, on_end=None):
+        self.source = source
+        self.name = display_name(source)
+        self.timings = StageTimer()
+        self.grabber = FrameGrabber(source, timings=self.timings)
+        self.processor = processor_factory(self.timings)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="live-analysis")
+        self.subscribers = set()
+        self.frames_analyzed = 0
+        self.updates_dropped = 0  # by viewers that have since left
+        self._frame_times = deque(maxlen=FPS_WINDOW_FRAMES)
+        self.error = None
+        self._on_end = on_end
+        self._stopped = False
+        self._task = None
+        self.started = asyncio.ensure_future(self._start())
+
+    async def _start(self):
+        # Opening a camera or network stream can block for seconds.
+        await asyncio.to_thread(self.grabber.start)
+        if self._stopped:
+            self.grabber.stop()
+            self._executor.shutdown(wait=False)
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        seq = 0
+        try:
+            while True:
+                latest = await self.grabber.get_latest(seq)
+                if latest is None: break
+                seq, frame = latest
+                with self.timings.time("analyze"):
+                    processed_frame, analysis_data = await loop.run_in_executor(self._executor, self.processor.analyze_frame, frame)
+                self.frames_analyzed += 1
+                self._frame_times.append(time.perf_counter())
+                update = LiveUpdate(processed_frame, analysis_data, self.grabber.frames_dropped)
+                for subscription in self.subscribers:
+                    subscription.offer(update)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.name} stopped delivering frames.")
+            self.error = "Video source stopped delivering frames."
+        except Exception as e:
+            logger.error(f"Live analysis failed for {self.name}: {e}", exc_info=True)
+            self.error = "An internal error occurred."
+        finally:
+            self.grabber.stop()
+            self._executor.shutdown(wait=False)
+            if self._on_end: self._on_end(self)
+        for subscription in self.subscribers:
+            subscription.offer(None)
+
+    def subscribe(self):
+        subscription = Subscription()
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription in self.subscribers:
+            self.subscribers.discard(subscription)
+            self.updates_dropped += subscription.dropped
+        return not self.subscribers
+
+    @property
+    def fps(self):
+        times = self._frame_times
+        if len(times) < 2 or times[-1] <= times[0]: return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def stop(self):
+        self._stopped = True
+        if self._task: self._task.cancel()
+        self.grabber.stop()
+
+    def stats(self):
+        return {
+            "source": self.name, "viewers": len(self.subscribers), "frames_analyzed": self.frames_analyzed,
+            "fps": round(self.fps, 2), "frames_dropped": self.grabber.frames_dropped,
+            "viewer_updates_dropped": [s.dropped for s in list(self.subscribers)],
+        }
+
+    def collect_metrics(self, out):
+        subscribers = list(self.subscribers)  # viewers come and go on the event loop
+        out.gauge("live_fps", "Frames analyzed per second, over the last few seconds.", round(self.fps, 3), stream=self.name)
+        out.gauge("live_viewers", "Viewers connected to the stream.", len(subscribers), stream=self.name)
+        out.gauge("live_viewer_queue_depth", "Updates waiting in viewer queues.", sum(s.queue.qsize() for s in subscribers), stream=self.name)
+        out.counter("live_frames_analyzed_total", "Frames analyzed for the stream.", self.frames_analyzed, stream=self.name)
+        out.counter("live_capture_frames_dropped_total", "Captured frames replaced by a newer one before analysis.", self.grabber.frames_dropped, stream=self.name)
+        out.counter("live_viewer_updates_dropped_total", "Updates dropped because a viewer fell behind.",
+                    self.updates_dropped + sum(s.dropped for s in subscribers), stream=self.name)
+        out.stages("live_stage_ms", "Per-frame latency of each live pipeline stage.", self.timings, stream=self.name)
+
+
+class StreamRegistry:
+    """Live streams keyed by resolved source. The first viewer of a camera starts its
+    pipeline, later viewers join it, and the last one to leave shuts it down."""
+
+    def __init__(self, processor_factory, max_streams=MAX_LIVE_STREAMS):
+        self.processor_factory = processor_factory
+        self.max_streams = max_streams
+        self._streams = {}
+
+    async def subscribe(self, source):
+        """Returns (stream, subscription). Raises ValueError for an unknown source,
+        StreamLimitError if max_streams other sources are already live, and IOError if it cannot be opened."""
+        key = resolve_source(source)
+        stream = self._streams.get(key)
+        if stream is None:
+            if len(self._streams) >= self.max_streams:
+                raise StreamLimitError(f"Too many live streams ({self.max_streams}); join a running one or try again later.")
+            stream = LiveStream(key, self.processor_factory, on_end=self._discard)
+            self._streams[key] = stream
+            logger.info(f"Started live stream for {stream.name}")
+        # Subscribe before waiting so a concurrent last viewer leaving can't stop it under us.
+        subscription = stream.subscribe()
+        try:
+            await asyncio.shield(stream.started)
+        except BaseException:
+            self.unsubscribe(stream, subscription)
+            raise
+        return stream, subscription
+
+    def unsubscribe(self, stream, subscription):
+        if stream.unsubscribe(subscription):
+            self._discard(stream)
+            stream.stop()
+            logger.info(f"Last viewer left, stopped live stream for {stream.name}")
+
+    def _discard(self, stream):
+        if self._streams.get(stream.source) is stream: del self._streams[stream.source]
+
+    def shutdown(self):
+        for stream in list(self._streams.values()):
+            stream.stop()
+        self._streams.clear()
+
+    def stats(self):
+        return [stream.stats() for stream in self._streams.values()]
+
+    def collect_metrics(self, out):
+        out.gauge("live_streams", "Live streams currently running.", len(self._streams))
+        for stream in list(self._streams.values()):
+            stream.collect_metrics(out)
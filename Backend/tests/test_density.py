@@ -0,0 +1,87 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from density import compute_grid_density, UnsafeCellMonitor  # noqa: E402
+
+
+# Reference versions of the per-track and per-cell loops that density.py replaced.
+
+def reference_grid_density(boxes, frame_w, frame_h, grid_size, heatmap_acc):
+    cell_w, cell_h = max(1, frame_w // grid_size), max(1, frame_h // grid_size)
+    grid_counts = np.zeros((grid_size, grid_size), dtype=int)
+    for box in boxes:
+        x1, y1, x2, y2 = map(int, box)
+        cx = (x1 + x2) // 2
+        cy = y1 + int((y2 - y1) * 0.8)
+        if 0 <= cx < frame_w and 0 <= cy < frame_h:
+            gx, gy = min(cx // cell_w, grid_size - 1), min(cy // cell_h, grid_size - 1)
+            grid_counts[gy, gx] += 1
+            heatmap_acc[cy, cx] += 1.0
+    return grid_counts
+
+
+class ReferenceUnsafeCells:
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.unsafe_active = {}
+
+    def update(self, grid_counts, frame_idx):
+        entered, cleared = [], []
+        grid_h, grid_w = grid_counts.shape
+        for gy in range(grid_h):
+            for gx in range(grid_w):
+                is_unsafe = int(grid_counts[gy, gx]) >= self.threshold
+                if is_unsafe and (gx, gy) not in self.unsafe_active:
+                    self.unsafe_active[(gx, gy)] = frame_idx
+                    entered.append((gx, gy))
+                elif not is_unsafe and (gx, gy) in self.unsafe_active:
+                    cleared.append(((gx, gy), self.unsafe_active.pop((gx, gy))))
+        return entered, cleared
+
+    def active(self):
+        return list(self.unsafe_active.items())
+
+
+def random_boxes(rng, n, frame_w, frame_h):
+    # Boxes may start left of / above the frame and run past its far edges.
+    x1 = rng.uniform(-0.3 * frame_w, 1.1 * frame_w, n)
+    y1 = rng.uniform(-0.3 * frame_h, 1.1 * frame_h, n)
+    w = rng.uniform(1, 0.4 * frame_w, n)
+    h = rng.uniform(1, 0.6 * frame_h, n)
+    return np.stack([x1, y1, x1 + w, y1 + h], axis=1)
+
+
+@pytest.mark.parametrize("frame_w,frame_h,grid_size", [(640, 480, 10), (1280, 720, 10), (101, 53, 7), (5, 5, 10)])
+def test_grid_density_matches_per_track_loop(frame_w, frame_h, grid_size):
+    rng = np.random.default_rng(frame_w * frame_h + grid_size)
+    expected_acc = np.zeros((frame_h, frame_w), dtype=np.float32)
+    actual_acc = np.zeros((frame_h, frame_w), dtype=np.float32)
+    for n in (0, 1, 5, 40, 200):
+        boxes = random_boxes(rng, n, frame_w, frame_h)
+        expected = reference_grid_density(boxes, frame_w, frame_h, grid_size, expected_acc)
+        actual = compute_grid_density(boxes, frame_w, frame_h, grid_size, actual_acc)
+        np.testing.assert_array_equal(actual, expected)
+        np.testing.assert_array_equal(actual_acc, expected_acc)
+
+
+def test_grid_density_without_heatmap():
+    rng = np.random.default_rng(0)
+    boxes = random_boxes(rng, 50, 640, 480)
+    expected = reference_grid_density(boxes, 640, 480, 10, np.zeros((480, 640), dtype=np.float32))
+    np.testing.assert_array_equal(compute_grid_density(boxes, 640, 480, 10), expected)
+
+
+@pytest.mark.parametrize("threshold", [1, 3, 6])
+def test_unsafe_monitor_matches_per_cell_loop(threshold):
+    rng = np.random.default_rng(threshold)
+    reference, monitor = ReferenceUnsafeCells(threshold), UnsafeCellMonitor(threshold)
+    for frame_idx in range(300):
+        boxes = random_boxes(rng, int(rng.integers(0, 80)), 640, 480)
+        grid_counts = compute_grid_density(boxes, 640, 480, 10)
+        assert monitor.update(grid_counts, frame_idx) == reference.update(grid_counts, frame_idx)
+        assert monitor.active() == reference.active()
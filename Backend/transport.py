@@ -0,0 +1,94 @@
+import json
+import threading
+import cv2
+
+# --- SETTINGS ---
+LIVE_JPEG_QUALITY = 80            # Default JPEG quality for live frames
+LIVE_JPEG_QUALITY_RANGE = (20, 95)
+LIVE_MAX_WIDTH = 1280             # Default downscale width for live frames (never upscaled)
+LIVE_MIN_WIDTH = 160
+PNG_COMPRESSION = 1               # Heatmaps are small and smooth; favour encode speed
+
+
+def parse_view_options(message):
+    """Per-client view settings from the websocket's opening message:
+    {"quality": 1-100, "max_width": pixels}. Missing or invalid values fall back to the defaults."""
+    def as_int(value, default):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return default
+
+    low, high = LIVE_JPEG_QUALITY_RANGE
+    quality = max(low, min(as_int(message.get("quality"), LIVE_JPEG_QUALITY), high))
+    max_width = max(LIVE_MIN_WIDTH, as_int(message.get("max_width"), LIVE_MAX_WIDTH))
+    return quality, max_width
+
+
+class EncodedFrame:
+    """An image plus its encodings, memoized per (format, quality, width) so every
+    viewer asking for the same settings shares one resize and one cv2.imencode call."""
+
+    def __init__(self, image):
+        self.image = image
+        self._lock = threading.Lock()
+        self._resized = {}
+        self._encoded = {}
+
+    def _scaled(self, max_width):
+        height, width = self.image.shape[:2]
+        if max_width is None or max_width >= width: return self.image
+        if max_width not in self._resized:
+            size = (max_width, max(1, round(height * max_width / width)))
+            self._resized[max_width] = cv2.resize(self.image, size, interpolation=cv2.INTER_AREA)
+        return self._resized[max_width]
+
+    def encode(self, ext=".jpg", quality=LIVE_JPEG_QUALITY, max_width=None):
+        key = (ext, quality, max_width)
+        # One lock per frame: concurrent viewers with the same settings wait for the first encode.
+        with self._lock:
+            if key not in self._encoded:
+                params = [cv2.IMWRITE_JPEG_QUALITY, quality] if ext == ".jpg" else [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION]
+                _, buffer = cv2.imencode(ext, self._scaled(max_width), params)
+                self._encoded[key] = buffer.tobytes()
+            return self._encoded[key]
+
+
+class LiveUpdate:
+    """Everything produced for one analyzed live frame, wire-ready.
+
+    On the socket an update is one JSON text message followed by the binary messages
+    named in its "attachments" list, in that order: "frame" (JPEG), then "heatmap" (PNG,
+    about once a second) and "prediction" (PNG, every 50 frames) when present. The JSON of
+    analyzed frames also carries the forecast risk level as "risk_forecast"."""
+
+    def __init__(self, processed_frame, analysis_data, dropped_frames=0):
+        data = dict(analysis_data)
+        heatmap = data.pop("liveHeatmap", None)
+        prediction = data.pop("livePrediction", None)
+        self.frame = EncodedFrame(processed_frame)
+        self.heatmap = EncodedFrame(heatmap) if heatmap is not None else None
+        self.prediction = EncodedFrame(prediction) if prediction is not None else None
+
+        self.metadata = {
+            "type": "frame",
+            "total_count": data["total_count"],
+            "alerts": data["alerts"],
+            "analysis_rate": data["analysis_rate"],
+            "dropped_frames": dropped_frames,
+        }
+        if "risk_forecast" in data: self.metadata["risk_forecast"] = data["risk_forecast"]
+        if "chartDataPoint" in data: self.metadata["chartDataPoint"] = data["chartDataPoint"]
+
+    def messages(self, quality=LIVE_JPEG_QUALITY, max_width=LIVE_MAX_WIDTH):
+        """Returns (metadata_json, [binary payloads]) for one viewer's settings. CPU-bound:
+        call from a worker thread."""
+        attachments, payloads = ["frame"], [self.frame.encode(".jpg", quality, max_width)]
+        if self.heatmap is not None:
+            attachments.append("heatmap")
+            payloads.append(self.heatmap.encode(".png", max_width=max_width))
+        if self.prediction is not None:
+            attachments.append("prediction")
+            payloads.append(self.prediction.encode(".png", max_width=max_width))
+        metadata = dict(self.metadata, attachments=attachments, frame_bytes=len(payloads[0]))
+        return json.dumps(metadata), payloads
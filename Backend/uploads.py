@@ -0,0 +1,137 @@
+import os
+import uuid
+import asyncio
+import hashlib
+import logging
+from python_multipart.multipart import MultipartParser, parse_options_header
+from python_multipart.exceptions import FormParserError
+
+logger = logging.getLogger(__name__)
+
+# --- SETTINGS ---
+UPLOAD_DIR = "uploads"
+UPLOAD_FIELD = "file"
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_MB", 2048)) * 1024 * 1024
+
+
+class UploadError(ValueError):
+    pass
+
+
+class UploadTooLargeError(UploadError):
+    pass
+
+
+class ReceivedUpload:
+    def __init__(self, path, filename, sha256, size):
+        self.path, self.filename, self.sha256, self.size = path, filename, sha256, size
+
+
+class _FilePartWriter:
+    """Collects the bytes of the upload's file part as the multipart parser emits them,
+    then writes and hashes them off the event loop."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.digest = hashlib.sha256()
+        self.path = self.filename = self._file = None
+        self.size = 0
+        self.done = False
+        self._pending = []
+        self._headers = {}
+        self._header_field = self._header_value = b""
+        self._in_file_part = False
+
+    # --- parser callbacks (synchronous, called from MultipartParser.write) ---
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name, filename = options.get(b"name", b"").decode(), options.get(b"filename", b"").decode("utf-8", "replace")
+        # Only the first file in the expected field is kept; other form fields are ignored.
+        self._in_file_part = name == UPLOAD_FIELD and bool(filename) and self._file is None and not self.done
+        if self._in_file_part:
+            self.filename = filename
+            # Client names only ever form a suffix: concurrent uploads of "clip.mp4" never collide.
+            basename = os.path.basename(filename.replace("\\", "/"))
+            self.path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}_{basename}")
+            self._file = open(self.path, "wb")
+
+    def on_part_data(self, data, start, end):
+        if not self._in_file_part: return
+        self.size += end - start
+        if self.size > self.max_bytes:
+            raise UploadTooLargeError(f"Upload exceeds the {self.max_bytes // (1024 * 1024)} MB limit.")
+        self._pending.append(data[start:end])
+
+    def on_part_end(self):
+        if self._in_file_part:
+            self._in_file_part = False
+            self.done = True
+
+    # --- called from the event loop ---
+    def _write_pending(self, chunks):
+        for chunk in chunks:
+            self.digest.update(chunk)
+            self._file.write(chunk)
+
+    async def flush(self):
+        if not self._pending: return
+        chunks, self._pending = self._pending, []
+        await asyncio.to_thread(self._write_pending, chunks)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+    def discard(self):
+        self.close()
+        if self.path and os.path.exists(self.path): os.remove(self.path)
+
+
+async def receive_upload(request, max_bytes=MAX_UPLOAD_BYTES):
+    """Streams the video in a multipart/form-data request body straight into a unique file
+    under UPLOAD_DIR, hashing it on the way. Unlike UploadFile, nothing is spooled to a
+    temporary file first. Raises UploadError for a bad request, UploadTooLargeError past max_bytes."""
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise UploadError("Expected a multipart/form-data upload.")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + 64 * 1024:
+        raise UploadTooLargeError(f"Upload exceeds the {max_bytes // (1024 * 1024)} MB limit.")
+
+    writer = _FilePartWriter(max_bytes)
+    callbacks = {name: getattr(writer, name) for name in (
+        "on_part_begin", "on_header_field", "on_header_value", "on_header_end",
+        "on_headers_finished", "on_part_data", "on_part_end")}
+    parser = MultipartParser(options[b"boundary"], callbacks)
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            await writer.flush()
+        parser.finalize()
+        await writer.flush()
+        writer.close()
+    except FormParserError as e:
+        writer.discard()
+        raise UploadError(f"Malformed upload: {e}")
+    except BaseException:
+        writer.discard()
+        raise
+
+    if not writer.done:
+        writer.discard()
+        raise UploadError(f"No video found in the '{UPLOAD_FIELD}' form field.")
+    logger.info(f"Received '{writer.filename}' ({writer.size / 1e6:.1f} MB) into {writer.path}")
+    return ReceivedUpload(writer.path, writer.filename, writer.digest.hexdigest(), writer.size)
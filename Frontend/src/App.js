@@ -11,14 +11,21 @@ import AlertsPanel from "./components/AlertsPanel";
 import DetailedGridChart from "./components/DetailedGridChart";
 import LiveAnalysis from "./components/LiveAnalysis";
 
+const API_BASE = "http://127.0.0.1:8000";
+const JOB_POLL_INTERVAL_MS = 1000;
+const MAX_CELL_CHART_POINTS = 1500;
+
 function App() {
   const [activePage, setActivePage] = useState("camera");
   const [isLoading, setIsLoading] = useState(false);
+  const [progress, setProgress] = useState(0);
   const [error, setError] = useState("");
   const [results, setResults] = useState(null);
+  const [jobId, setJobId] = useState(null);
 
   const [selectedCell, setSelectedCell] = useState(null);
   const [detailedCellData, setDetailedCellData] = useState([]);
+  const [detailedCellFrames, setDetailedCellFrames] = useState([]);
   
   // --- NEW: State to hold alerts from the live feed ---
   const [liveAlerts, setLiveAlerts] = useState([]);
@@ -29,6 +36,7 @@ function App() {
       return;
     }
     setIsLoading(true);
+    setProgress(0);
     setError("");
     setResults(null);
     setSelectedCell(null);
@@ -38,11 +46,20 @@ function App() {
     const formData = new FormData();
     formData.append("file", file);
     try {
-      const response = await axios.post("http://127.0.0.1:8000/analyze/", formData, {
+      const { data: job } = await axios.post(`${API_BASE}/analyze/`, formData, {
         headers: { "Content-Type": "multipart/form-data" },
       });
+      // The backend queues the analysis; poll the job until it finishes.
+      let status = job;
+      while (status.status !== "completed" && status.status !== "failed") {
+        await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+        ({ data: status } = await axios.get(`${API_BASE}/jobs/${job.job_id}`));
+        setProgress(status.progress ?? 0);
+      }
+      const response = await axios.get(`${API_BASE}/jobs/${job.job_id}/result`);
       console.log("✅ [App.js] SUCCESS: Data received from backend:", response.data);
       setResults(response.data);
+      setJobId(job.job_id);
       setActivePage("analytics");
     } catch (err) {
       console.error("❌ [App.js] ERROR: Failed to get data from backend:", err);
@@ -52,16 +69,26 @@ function App() {
     }
   };
 
-  const handleGridCellClick = (row, col) => {
-    if (!results || !results.grid_counts_over_time) return;
-    const cellData = results.grid_counts_over_time.map(gridFrame => gridFrame?.[row]?.[col] ?? 0);
-    setDetailedCellData(cellData);
+  const handleGridCellClick = async (row, col) => {
+    if (!results || !jobId) return;
     setSelectedCell({ row, col });
+    setDetailedCellData([]);
+    setDetailedCellFrames([]);
+    // Only this cell's series is fetched, sampled down to at most MAX_CELL_CHART_POINTS frames.
+    const stride = Math.max(1, Math.ceil((results.grid_counts_frames ?? 0) / MAX_CELL_CHART_POINTS));
+    try {
+      const { data } = await axios.get(`${API_BASE}/jobs/${jobId}/grid_counts`, { params: { row, col, stride } });
+      setDetailedCellData(data.counts);
+      setDetailedCellFrames(data.indices);
+    } catch (err) {
+      console.error("❌ [App.js] ERROR: Failed to load grid cell history:", err);
+    }
   };
 
   const handleCloseDetailedChart = () => {
     setSelectedCell(null);
     setDetailedCellData([]);
+    setDetailedCellFrames([]);
   };
 
   // --- NEW: Clear live alerts when navigating away from the live page ---
@@ -80,6 +107,7 @@ function App() {
           <CameraFeeds
             onAnalyze={handleAnalyzeVideo}
             isLoading={isLoading}
+            progress={progress}
             error={error}
           />
         )}
@@ -123,6 +151,7 @@ function App() {
 
       <DetailedGridChart 
         data={detailedCellData}
+        frames={detailedCellFrames}
         selectedCell={selectedCell}
         onClose={handleCloseDetailedChart}
       />
@@ -1,7 +1,7 @@
 import { useState } from "react";
 import { Upload, XCircle, Loader } from "lucide-react";
 
-export default function CameraFeeds({ onAnalyze, isLoading, error }) {
+export default function CameraFeeds({ onAnalyze, isLoading, progress = 0, error }) {
   const [selectedFile, setSelectedFile] = useState(null);
   const [fileName, setFileName] = useState("");
 
@@ -60,7 +60,7 @@ export default function CameraFeeds({ onAnalyze, isLoading, error }) {
         {isLoading ? (
           <>
             <Loader className="animate-spin w-5 h-5" />
-            Analyzing... (This may take a minute)
+            Analyzing... {Math.round(progress)}%
           </>
         ) : (
           "Start Analysis"
@@ -2,15 +2,16 @@ import React from "react";
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer } from "recharts";
 import { X } from "lucide-react";
 
-export default function DetailedGridChart({ data, selectedCell, onClose }) {
+export default function DetailedGridChart({ data, frames, selectedCell, onClose }) {
   // Don't render anything if no cell is selected
   if (!selectedCell) {
     return null;
   }
 
   // Format the data for the chart, adding a 'frame' number for the X-axis
+  // (taken from `frames` when the series was sampled with a stride)
   const chartData = data.map((count, index) => ({
-    frame: index,
+    frame: frames?.[index] ?? index,
     count: count,
   }));
 
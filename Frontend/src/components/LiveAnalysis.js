@@ -6,9 +6,15 @@ export default function LiveAnalysis() {
     const [isLive, setIsLive] = useState(false);
     const [isLoading, setIsLoading] = useState(false);
     const [error, setError] = useState(null);
-    const [stats, setStats] = useState({ count: 0, alerts: [] });
+    const [stats, setStats] = useState({ count: 0, alerts: [], analysisRate: null });
+    const [heatmapUrl, setHeatmapUrl] = useState(null);
+    const [predictionUrl, setPredictionUrl] = useState(null);
+    const [predictedRisk, setPredictedRisk] = useState(null);
     const socketRef = useRef(null);
     const imageRef = useRef(null);
+    // Binary messages that follow the current metadata message, in order ("frame", "heatmap", ...)
+    const pendingAttachmentsRef = useRef([]);
+    const objectUrlsRef = useRef({});
 
     // Effect to gracefully disconnect the WebSocket when the component unmounts
     useEffect(() => {
@@ -16,9 +22,26 @@ export default function LiveAnalysis() {
             if (socketRef.current) {
                 socketRef.current.close();
             }
+            Object.values(objectUrlsRef.current).forEach(URL.revokeObjectURL);
         };
     }, []);
 
+    // Swap in a new blob URL for an attachment and release the one it replaces
+    const showAttachment = (kind, blob) => {
+        const type = kind === "frame" ? "image/jpeg" : "image/png";
+        const url = URL.createObjectURL(new Blob([blob], { type }));
+        if (objectUrlsRef.current[kind]) URL.revokeObjectURL(objectUrlsRef.current[kind]);
+        objectUrlsRef.current[kind] = url;
+
+        if (kind === "frame") {
+            if (imageRef.current) imageRef.current.src = url;
+        } else if (kind === "heatmap") {
+            setHeatmapUrl(url);
+        } else if (kind === "prediction") {
+            setPredictionUrl(url);
+        }
+    };
+
     const startWebcamStream = () => {
         setIsLoading(true);
         setError(null);
@@ -31,11 +54,19 @@ export default function LiveAnalysis() {
             console.log("✅ [LiveAnalysis] WebSocket connection established.");
             setIsLoading(false);
             setIsLive(true);
-            // Tell the backend to start using the webcam (source 0)
-            ws.send(JSON.stringify({ source: "webcam" }));
+            // Tell the backend to start using the webcam (source 0); frames are scaled to fit this view
+            const maxWidth = Math.round((imageRef.current?.clientWidth || 1280) * (window.devicePixelRatio || 1));
+            ws.send(JSON.stringify({ source: "webcam", quality: 75, max_width: maxWidth }));
         };
 
         ws.onmessage = (event) => {
+            // Binary messages carry the images announced by the preceding metadata message
+            if (typeof event.data !== "string") {
+                const kind = pendingAttachmentsRef.current.shift();
+                if (kind) showAttachment(kind, event.data);
+                return;
+            }
+
             const data = JSON.parse(event.data);
 
             if (data.error) {
@@ -44,14 +75,15 @@ export default function LiveAnalysis() {
                 return;
             }
 
-            // Update the image source with the new frame from the backend
-            if (imageRef.current && data.frame) {
-                imageRef.current.src = `data:image/jpeg;base64,${data.frame}`;
+            pendingAttachmentsRef.current = data.attachments || [];
+            if (data.risk_forecast) {
+                setPredictedRisk(data.risk_forecast.expected_risk_level);
             }
             // Update the stats
             setStats({
                 count: data.total_count,
-                alerts: data.alerts || []
+                alerts: data.alerts || [],
+                analysisRate: data.analysis_rate?.analysis_rate ?? null
             });
         };
 
@@ -76,7 +108,11 @@ export default function LiveAnalysis() {
         }
         setIsLive(false);
         // Reset stats when stopping
-        setStats({ count: 0, alerts: [] });
+        setStats({ count: 0, alerts: [], analysisRate: null });
+        setHeatmapUrl(null);
+        setPredictionUrl(null);
+        setPredictedRisk(null);
+        pendingAttachmentsRef.current = [];
     };
 
     return (
@@ -123,7 +159,25 @@ export default function LiveAnalysis() {
                     <div className="bg-neutral-800 p-4 rounded-lg">
                         <h3 className="font-semibold text-neutral-400 mb-2">Current People Count</h3>
                         <p className="text-5xl font-bold text-blue-400">{stats.count}</p>
+                        {stats.analysisRate !== null && (
+                            <p className="text-xs text-neutral-500 mt-2">Analyzing {stats.analysisRate} frames/s</p>
+                        )}
                     </div>
+                    {heatmapUrl && (
+                        <div className="bg-neutral-800 p-4 rounded-lg">
+                            <h3 className="font-semibold text-neutral-400 mb-2">Density Heatmap</h3>
+                            <img src={heatmapUrl} alt="Live density heatmap" className="w-full rounded-md" />
+                        </div>
+                    )}
+                    {predictionUrl && (
+                        <div className="bg-neutral-800 p-4 rounded-lg">
+                            <h3 className="font-semibold text-neutral-400 mb-2">Predicted Density</h3>
+                            <img src={predictionUrl} alt="Predicted crowd density" className="w-full rounded-md" />
+                            {predictedRisk && (
+                                <p className="text-xs text-neutral-500 mt-2">Predicted risk: {predictedRisk}</p>
+                            )}
+                        </div>
+                    )}
                     <div className="bg-neutral-800 p-4 rounded-lg h-96 overflow-y-auto">
                          <h3 className="font-semibold text-neutral-400 mb-2 flex items-center gap-2"><AlertTriangle className="text-yellow-400"/> Live Alerts</h3>
                         {stats.alerts.length > 0 ? (